@@ -0,0 +1,367 @@
+"""
+Offline benchmark harness.
+
+Spins up local stand-ins for the RSS feeds, the Gemini REST API and the
+Telegram Bot API, points the bot at them through GEMINI_API_BASE /
+TELEGRAM_API_BASE, and drives the hot paths:
+
+    scrape   scrape_feeds over generated feeds
+    ai       generate_post + critique_post
+    publish  send_post
+    digest   build_and_send_digest
+    e2e      main.main()
+
+For each scenario it reports latency percentiles, throughput and the number
+of calls each fake API received. Every iteration runs in a fresh temp
+directory, so history/cache files of the real checkout are never touched.
+
+    python benchmarks/bench.py --iterations 5 --gemini-latency 0.2 --gemini-429-rate 0.1
+    python benchmarks/bench.py --json results.json
+    python benchmarks/bench.py --compare results.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["scrape", "ai", "publish", "digest", "e2e"]
+
+FAKE_DRAFT = """**BenchApp | Отчёты в 1 клик | $5k MRR**
+
+🎯 **Проблема и Решение**:
+Избавляет маркетолога от 4 часов рутины. **Суть (JTBD): увольняем аналитика**.
+
+🛠 **Стек и Цена запуска**:
+**AI-Coding**: Cursor + Supabase. Можно собрать за выходные.
+
+🚀 **Как нашли первых клиентов**:
+Запостили в 5 сабреддитов и дали бесплатный триал.
+
+💰 **Деньги**:
+Подписка $19/мес, 260 платящих клиентов.
+
+💡 **Вердикт**:
+Стоит копировать прямо сейчас.
+
+Источник: [Reddit](https://www.reddit.com/comments/bench)
+#saas #nocode
+"""
+
+
+class FakeServices:
+    """RSS + Gemini + Telegram stand-ins on one local threaded HTTP server."""
+
+    def __init__(self, feeds=7, articles_per_feed=25, gemini_latency=0.0, gemini_429_rate=0.0,
+                 retry_delay=0.5, telegram_latency=0.0, feed_latency=0.0, seed=1):
+        self.feeds = feeds
+        self.articles_per_feed = articles_per_feed
+        self.gemini_latency = gemini_latency
+        self.gemini_429_rate = gemini_429_rate
+        self.retry_delay = retry_delay
+        self.telegram_latency = telegram_latency
+        self.feed_latency = feed_latency
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.feed_bodies = {i: self._build_feed(i) for i in range(feeds)}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    @property
+    def feed_urls(self):
+        return [f"{self.base_url}/feeds/{i}.rss" for i in range(self.feeds)]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.calls.clear()
+
+    def _build_feed(self, index):
+        tools = ["Bubble", "Cursor", "Replit", "Make", "Supabase", "Webflow"]
+        items = []
+        for i in range(self.articles_per_feed):
+            title = f"How I built app {index}-{i} with {tools[i % len(tools)]} to ${i + 1}k MRR"
+            summary = (f"&lt;p&gt;We launched on Reddit and got {10 * i} paying customers. "
+                       f"Stack: {tools[(i + index) % len(tools)]} and Stripe. Story number {index}-{i}.&lt;/p&gt;")
+            items.append(
+                f"<item><guid>bench-{index}-{i}</guid><title>{title}</title>"
+                f"<link>https://example.com/{index}/{i}?utm_source=rss</link>"
+                f"<description>{summary}</description></item>"
+            )
+        return f'<?xml version="1.0"?><rss version="2.0"><channel><title>Feed {index}</title>{"".join(items)}</channel></rss>'.encode()
+
+    def _gemini_reply(self, prompt):
+        if "РЕЖИМ ПАКЕТА" in prompt:
+            ids = re.findall(r"### id: (\d+)", prompt)
+            key = "score" if "Черновики" in prompt else "post"
+            value = 8 if key == "score" else FAKE_DRAFT
+            return json.dumps([{"id": i, key: value} for i in ids], ensure_ascii=False)
+        if "Черновик поста" in prompt:
+            return "8"
+        if "Список статей" in prompt:
+            ids = re.findall(r"### id: (\S+)", prompt)
+            return json.dumps([{"id": i, "annotation": f"Аннотация {i}"} for i in ids], ensure_ascii=False)
+        return FAKE_DRAFT
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json", headers=None):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path.startswith("/feeds/"):
+                    services.count("rss")
+                    time.sleep(services.feed_latency)
+                    index = int(path.rsplit("/", 1)[1].split(".")[0])
+                    return self._send(200, services.feed_bodies[index], "application/rss+xml")
+                if path.endswith("/models"):
+                    services.count("gemini_models")
+                    return self._send(200, {"models": [
+                        {"name": "models/gemini-2.5-flash-lite", "supportedGenerationMethods": ["generateContent"]},
+                        {"name": "models/gemini-flash-lite-latest", "supportedGenerationMethods": ["generateContent"]},
+                        {"name": "models/gemini-2.0-flash-lite", "supportedGenerationMethods": ["generateContent"]},
+                    ]})
+                self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if ":generateContent" in path:
+                    services.count("gemini")
+                    time.sleep(services.gemini_latency)
+                    with services.lock:
+                        throttled = services.random.random() < services.gemini_429_rate
+                    if throttled:
+                        services.count("gemini_429")
+                        return self._send(429, {"error": {"code": 429, "details": [{
+                            "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                            "retryDelay": f"{services.retry_delay}s",
+                        }]}})
+                    prompt = json.loads(body)["contents"][0]["parts"][0]["text"]
+                    text = services._gemini_reply(prompt)
+                    return self._send(200, {
+                        "candidates": [{"content": {"parts": [{"text": text}]}}],
+                        "usageMetadata": {"promptTokenCount": len(prompt) // 4,
+                                          "candidatesTokenCount": len(text) // 4,
+                                          "totalTokenCount": (len(prompt) + len(text)) // 4},
+                    })
+                if path.startswith("/bot"):
+                    services.count("telegram")
+                    time.sleep(services.telegram_latency)
+                    return self._send(200, {"ok": True, "result": {"message_id": 1}})
+                self._send(404, {"error": "not found"})
+
+        return Handler
+
+
+def _configure_environment(services):
+    """Must run before any `src` import: config reads the environment once."""
+    os.environ.update({
+        "GEMINI_API_KEY": "bench",
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHANNEL_ID": "@bench",
+        "GEMINI_API_BASE": f"{services.base_url}/v1beta",
+        "TELEGRAM_API_BASE": services.base_url,
+    })
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def _reset_process_state():
+    """Drops in-process caches so each iteration starts cold in its temp dir."""
+    from src import utils, dedupe, ai_engine, model_health
+    utils.reset_history_cache()
+    utils.reset_digest_cache()
+    dedupe._index = None
+    ai_engine._llm_cache = None
+    ai_engine._rate_limiters.clear()
+    model_health._health = None
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _run_scenario(name, body, services, iterations):
+    latencies, items, calls = [], 0, Counter()
+    for iteration in range(iterations):
+        with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+            os.chdir(workdir)
+            _reset_process_state()
+            services.reset_counts()
+            started = time.perf_counter()
+            items += body(iteration)
+            latencies.append(time.perf_counter() - started)
+            calls.update(services.calls)
+            os.chdir(ROOT)
+    total = sum(latencies)
+    return {
+        "iterations": iterations,
+        "p50": round(_percentile(latencies, 50), 4),
+        "p95": round(_percentile(latencies, 95), 4),
+        "max": round(max(latencies), 4),
+        "throughput": round(items / total, 2) if total else None,
+        "api_calls": {k: v / iterations for k, v in sorted(calls.items())},
+    }
+
+
+def run_benchmarks(args):
+    services = FakeServices(
+        feeds=args.feeds,
+        articles_per_feed=args.articles_per_feed,
+        gemini_latency=args.gemini_latency,
+        gemini_429_rate=args.gemini_429_rate,
+        retry_delay=args.retry_delay,
+        telegram_latency=args.telegram_latency,
+        feed_latency=args.feed_latency,
+    ).start()
+    _configure_environment(services)
+
+    import main as bot_main
+    from src import ai_engine, publisher, scraper, utils
+    from src.digest import build_and_send_digest
+
+    # Measure our code, not Google's free-tier quotas or Telegram's spacing
+    ai_engine.DEFAULT_RATE_LIMIT = {"rpm": 10_000, "tpm": 10**9}
+    ai_engine.MODEL_RATE_LIMITS.clear()
+    publisher.TELEGRAM_MIN_INTERVAL = 0.0
+    bot_main.RSS_FEEDS = services.feed_urls
+
+    def scrape(_):
+        return len(scraper.scrape_feeds(services.feed_urls, use_cache=False))
+
+    def ai(iteration):
+        for i in range(args.ai_articles):
+            draft = ai_engine.generate_post(f"Title: bench {iteration}-{i}\nSummary: $5k MRR with Bubble")
+            ai_engine.critique_post(draft)
+        return args.ai_articles
+
+    def publish(_):
+        for _ in range(args.posts):
+            publisher.send_post(FAKE_DRAFT, None)
+        return args.posts
+
+    def digest(_):
+        for i in range(7):
+            utils.add_to_digest(f"Bench case {i}", f"https://example.com/digest/{i}")
+        build_and_send_digest()
+        return 1
+
+    def e2e(_):
+        bot_main.main()
+        return 1
+
+    bodies = {"scrape": scrape, "ai": ai, "publish": publish, "digest": digest, "e2e": e2e}
+    results = {}
+    try:
+        for name in args.scenarios:
+            print(f"\n=== {name} ===")
+            results[name] = _run_scenario(name, bodies[name], services, args.iterations)
+    finally:
+        os.chdir(ROOT)
+        services.stop()
+    return results
+
+
+def print_report(results):
+    print("\n" + "=" * 72)
+    print(f"{'scenario':<10}{'p50 s':>10}{'p95 s':>10}{'max s':>10}{'items/s':>12}  api calls/iter")
+    for name, r in results.items():
+        calls = ", ".join(f"{k}={v:g}" for k, v in r["api_calls"].items())
+        print(f"{name:<10}{r['p50']:>10.3f}{r['p95']:>10.3f}{r['max']:>10.3f}{r['throughput'] or 0:>12.1f}  {calls}")
+
+
+def compare(results, baseline_path, tolerance):
+    """Returns the scenarios whose p50 regressed by more than `tolerance` (fraction)."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p50"], r["p50"]
+        change = (after - before) / before if before else 0.0
+        print(f"{name:<10} p50 {before:.3f}s -> {after:.3f}s ({change:+.0%})")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake RSS/Gemini/Telegram servers.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--feeds", type=int, default=7)
+    parser.add_argument("--articles-per-feed", type=int, default=25)
+    parser.add_argument("--feed-latency", type=float, default=0.05, help="seconds per feed response")
+    parser.add_argument("--gemini-latency", type=float, default=0.1, help="seconds per Gemini response")
+    parser.add_argument("--gemini-429-rate", type=float, default=0.0, help="fraction of Gemini calls answered with 429")
+    parser.add_argument("--retry-delay", type=float, default=0.5, help="retryDelay advertised in injected 429s")
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--ai-articles", type=int, default=3, help="articles per 'ai' iteration")
+    parser.add_argument("--posts", type=int, default=3, help="posts per 'publish' iteration")
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 regression (fraction)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results written to {args.json_path}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,23 @@
 import requests
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+from src.config import GEMINI_API_KEY
+from src.model_registry import fetch_models
 
 def list_models():
     if not GEMINI_API_KEY:
         print("Error: GEMINI_API_KEY not found in environment variables.")
         return
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models?key={GEMINI_API_KEY}"
-    
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        # Also refreshes models_cache.json used by the bot's model selection
+        models = fetch_models()
         
         print("Available Models:")
-        if 'models' in data:
-            for model in data['models']:
+        if models:
+            for model in models:
                 print(f"- {model['name']}")
-                print(f"  Supported methods: {model.get('supportedGenerationMethods', [])}")
+                print(f"  Supported methods: {model['methods']}")
         else:
             print("No models found in response.")
-            print(data)
             
     except requests.exceptions.RequestException as e:
         print(f"Error listing models: {e}")
@@ -0,0 +1,116 @@
+"""
+Command-line front-end.
+
+    python cli.py run [--pipeline | --batch] [--daemon]
+    python cli.py digest
+    python cli.py check-models
+    python cli.py render-cover "Title" --tools "Bubble + Stripe" --revenue "$5k MRR"
+    python cli.py bench [bench.py options...]
+
+Each subcommand imports only what it needs, after the arguments are parsed,
+so `--help`, `digest` and `check-models` never load feedparser or Pillow.
+`--import-times` prints how long each subcommand's imports took.
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+_started_at = time.perf_counter()
+_import_log = []
+
+
+def _import(name):
+    """importlib.import_module, recording the time and the modules it pulled in."""
+    loaded_before = len(sys.modules)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_log.append((name, time.perf_counter() - start, len(sys.modules) - loaded_before))
+    return module
+
+
+def _print_import_report():
+    print("\nImport times:", file=sys.stderr)
+    for name, seconds, new_modules in _import_log:
+        print(f"  {name:<22}{seconds * 1000:8.1f} ms  ({new_modules} modules)", file=sys.stderr)
+    for heavy in ("requests", "feedparser", "PIL"):
+        print(f"  {heavy:<22}{'loaded' if heavy in sys.modules else 'not loaded':>11}", file=sys.stderr)
+    print(f"  total startup + run   {(time.perf_counter() - _started_at) * 1000:8.1f} ms", file=sys.stderr)
+
+
+def cmd_run(args):
+    main = _import("main")
+    entry = main.daemon if args.daemon else main.main
+    entry(pipeline=args.pipeline, batch=args.batch)
+
+
+def cmd_digest(args):
+    digest = _import("src.digest")
+    return 0 if digest.build_and_send_digest() else 1
+
+
+def cmd_check_models(args):
+    _import("check_models").list_models()
+
+
+def cmd_render_cover(args):
+    image_generator = _import("src.image_generator")
+    path = image_generator.create_cover(args.title, args.tools, args.revenue, fmt=args.format)
+    if not path:
+        return 1
+    print(path)
+
+
+def cmd_bench(args):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+    return _import("bench").main(args.bench_args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="The Builder bot.")
+    parser.add_argument("--import-times", action="store_true", help="report import time per subcommand")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="scrape, review and publish (one run, or --daemon)")
+    mode = run.add_mutually_exclusive_group()
+    mode.add_argument("--pipeline", action="store_true", help="concurrent draft/critique stages")
+    mode.add_argument("--batch", action="store_true", help="one batched request per stage")
+    run.add_argument("--daemon", action="store_true", help="stay up and publish at the scheduled slots")
+    run.set_defaults(handler=cmd_run)
+
+    digest = commands.add_parser("digest", help="send the weekly digest")
+    digest.set_defaults(handler=cmd_digest)
+
+    check = commands.add_parser("check-models", help="list Gemini models and refresh models_cache.json")
+    check.set_defaults(handler=cmd_check_models)
+
+    cover = commands.add_parser("render-cover", help="render a cover image and print its path")
+    cover.add_argument("title")
+    cover.add_argument("--tools", default="No-code / AI")
+    cover.add_argument("--revenue", default="")
+    cover.add_argument("--format", default="JPEG", choices=["JPEG", "PNG", "WEBP"])
+    cover.set_defaults(handler=cmd_render_cover)
+
+    # Unrecognized options after `bench` are handed to benchmarks/bench.py as-is
+    bench = commands.add_parser("bench", help="offline benchmarks (options as for benchmarks/bench.py)")
+    bench.set_defaults(handler=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        args.bench_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    try:
+        return args.handler(args) or 0
+    finally:
+        if args.import_times:
+            _print_import_report()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,45 +1,81 @@
-import time
-import re
-import os
-from src.config import RSS_FEEDS
-from src.scraper import scrape_feeds
-from src.utils import is_url_processed, add_url_to_history, add_to_digest
+import sys
+from src.config import RSS_FEEDS, MAX_ARTICLES_TO_CHECK, MAX_ARTICLES_TO_PUBLISH, CANDIDATE_POOL_SIZE
+from src.scraper import iter_feeds
+from src.utils import is_url_processed, add_article_to_history
 from src.ai_engine import generate_post, critique_post
-from src.image_generator import create_cover
-from src.publisher import send_post
+from src.publisher import start_drainer, stop_drainer
+from src.model_registry import get_cached_models, generate_content_models
+from src.ranker import rank_articles
+from src import metrics
+from src.dedupe import filter_near_duplicates
+from src.urls import canonicalize_url
+from src.pipeline import publish_article, record_published, queued_links, build_article_content, is_skip_post, is_critique_bypass, run_pipeline_sync, run_batch
 
-def main():
+# How long main() waits at exit for queued posts to be delivered
+PUBLISH_DRAIN_TIMEOUT = 300
+
+def main(pipeline=False, batch=False):
     print("Starting The Builder v1.5...")
 
-    # Check available models first
+    # Deliver leftovers from earlier runs and anything queued during this one
+    start_drainer(on_sent=record_published)
     try:
-        import requests
-        from src.config import GEMINI_API_KEY
-        url = f"https://generativelanguage.googleapis.com/v1beta/models?key={GEMINI_API_KEY}"
-        response = requests.get(url)
-        if response.status_code == 200:
-            print("Available Gemini Models:")
-            models = [m['name'].replace('models/', '') for m in response.json().get('models', []) if 'generateContent' in m.get('supportedGenerationMethods', [])]
-            print(f"  {', '.join(models)}")
-        else:
-            print(f"Warning: Could not list models. Status: {response.status_code}")
-    except Exception as e:
-        print(f"Warning: Model check failed: {e}")
+        with metrics.timer("run"):
+            run_once(pipeline=pipeline, batch=batch)
+    finally:
+        print("Waiting for the outbox to drain...")
+        with metrics.timer("drain_outbox"):
+            stop_drainer(timeout=PUBLISH_DRAIN_TIMEOUT)
+        metrics.write_summary()
+
+def run_once(pipeline=False, batch=False):
+    # Model discovery is cached on disk (see src/model_registry.py); a stale
+    # cache is refreshed in the background instead of blocking startup
+    models = get_cached_models()
+    if models:
+        print("Available Gemini Models (cached):")
+        print(f"  {', '.join(generate_content_models(models))}")
     
-    # 1. Scrape
+    articles = collect_candidates()
+    published = process_candidates(articles, pipeline=pipeline, batch=batch)
+    if not published:
+        print("No new qualified articles found/published this run.")
+
+def collect_candidates():
+    # 1. Scrape (streaming: stop fetching once the candidate pool is full)
     print("Step 1: Scraping RSS feeds...")
-    articles = scrape_feeds(RSS_FEEDS)
-    print(f"Step 1 Complete: Found {len(articles)} total articles")
+    articles = []
+    # Articles whose post still waits in the outbox are not history yet, but taken
+    queued = queued_links()
+    with metrics.timer("scrape"):
+        stream = iter_feeds(RSS_FEEDS, only_due=True)
+        for article in stream:
+            if is_url_processed(article['link']) or canonicalize_url(article['link']) in queued:
+                continue
+            articles.append(article)
+            if len(articles) >= CANDIDATE_POOL_SIZE:
+                break
+        stream.close()
+    print(f"Step 1 Complete: Found {len(articles)} new articles")
+    metrics.incr("articles_scraped", len(articles))
+    return articles
+
+def process_candidates(articles, pipeline=False, batch=False):
+    """Dedupes, ranks and runs candidates through AI review; returns how many were published."""
+    # Drop cross-posted stories, then rank the rest locally so Gemini only sees the top candidates
+    with metrics.timer("dedupe_rank"):
+        articles = filter_near_duplicates(articles)
+        articles = rank_articles(articles, top_k=MAX_ARTICLES_TO_CHECK)
+    print(f"Ranked candidates: {len(articles)} selected for AI review")
+
+    if pipeline or batch:
+        # Concurrent stages, or one batched request per stage
+        return len(run_batch(articles) if batch else run_pipeline_sync(articles))
     
     # 2. Filter & Process
     processed_count = 0
     
-    # Limit the number of articles to CHECK and PUBLISH per run
-    # 'MAX_CHECKED' limits API usage (don't burn all credits on junk)
-    # 'MAX_PUBLISHED' ensures we don't spam the channel
-    MAX_ARTICLES_TO_CHECK = 5 
-    MAX_ARTICLES_TO_PUBLISH = 1
-    
+    # Limits on checked/published articles live in src/config.py
     articles_checked_count = 0
     
     for article in articles:
@@ -62,72 +98,80 @@ def main():
         
         # 3. Generate Draft
         # Combine title and summary for better context
-        content = f"Title: {article['title']}\nLink: {article['link']}\nSource: {article['source']}\nSummary: {article['summary']}"
+        content = build_article_content(article)
         
-        # Add delay to respect rate limits
-        # Increased to 30s to be extra safe with Free Tier
-        print("Waiting 30s to cool down API...")
-        time.sleep(30) 
+        # Rate limits are enforced per model inside call_gemini_api
         print("Calling AI to generate post...")
-        draft_post = generate_post(content)
+        with metrics.timer("generate"):
+            draft_post = generate_post(content)
         
         if not draft_post:
             print("Failed to generate draft. Skipping.")
             continue
             
         # Robust SKIP check: catches "SKIP", "SKIP.", "SKIP!", "skip", "SKIP\nпояснение..." etc.
-        if draft_post.strip().upper().startswith("SKIP"):
+        if is_skip_post(draft_post):
             print("🚫 AI decided to skip this article (Not a specific project/SaaS).")
+            metrics.incr("skipped_by_writer")
             # We treat it as processed so we don't try it again and waste API credits? 
             # Actually, let's NOT add to history, maybe we improve prompt later. 
             # But to avoid loop in this run, we just continue. 
             # Update: If we don't add to history, it might appear in next run. 
             # Let's add to history essentially saying "we saw it and it's junk".
-            add_url_to_history(article['link'])
+            add_article_to_history(article)
             continue
 
         print("Draft generated.")
         
         # 4. Critique
-        print("Waiting 30s before critique...")
-        time.sleep(30) # Delay before critique
-        score = critique_post(draft_post)
+        with metrics.timer("critique"):
+            score = critique_post(draft_post)
         print(f"Critique Score: {score}/10")
         
         if score < 6:
             # Emergency Bypass: If score is 0 (API failure) but draft is long enough, publish anyway
             # This prevents losing valid posts due to Rate Limits on the critique step
             # Guard: Never bypass for SKIP posts (even long ones with explanations)
-            is_skip_post = draft_post.strip().upper().startswith("SKIP")
-            if score == 0 and len(draft_post) > 500 and not is_skip_post:
+            if is_critique_bypass(score, draft_post):
                 print("⚠️ Critique API failed (Rate Limit), but draft looks valid (>500 chars). PUBLISHING ANYWAY.")
             else:
                 print("Score too low. Skipping.")
+                metrics.incr("rejected_by_critic")
                 if score == 0:
                      print("Score is 0. Might be API error or terrible post. NOT adding to history to retry later.")
                 else:
-                     add_url_to_history(article['link']) 
+                     add_article_to_history(article) 
                 continue
             
         # 5. Generate Image - DISABLED per user request (relying on Link Preview)
+        # (re-enabling: import create_cover/COVER_DISPLAY_SIZE from src.image_generator
+        # here rather than at module level, so runs without covers don't load Pillow)
         # tools = "No-code / AI" 
         # revenue = ""
-        # image_path = create_cover(article['title'], tools, revenue)
+        # image_path = create_cover(article['title'], tools, revenue, in_memory=True, display_size=COVER_DISPLAY_SIZE)
         image_path = None
         
-        # 6. Publish
-        if send_post(draft_post, image_path):
-            add_url_to_history(article['link'])
-            add_to_digest(article['title'], article['link'])
-            print(f"Successfully published: {article['title']}")
+        # 6. Publish (queued in the outbox; the background drainer delivers it)
+        if publish_article(article, draft_post, image_path):
+            print(f"Queued for publishing: {article['title']}")
             processed_count += 1
             # Stop after one successful post to spread out content
             break 
         else:
             print("Failed to publish. Check BOT_TOKEN and CHANNEL_ID.")
-            
-    if processed_count == 0:
-        print("No new qualified articles found/published this run.")
+
+    return processed_count
+
+def daemon(pipeline=False, batch=False):
+    """Keeps running and publishes at fixed slots (see src/daemon.py)."""
+    from src.daemon import run_daemon
+    print("Starting The Builder v1.5 (daemon mode)...")
+    run_daemon(lambda articles: process_candidates(articles, pipeline=pipeline, batch=batch))
 
 if __name__ == "__main__":
-    main()
+    # `python main.py --pipeline` runs candidates through the concurrent pipeline,
+    # `python main.py --batch` drafts and critiques them in one request each,
+    # `python main.py --daemon` stays up and publishes at the scheduled slots
+    args = sys.argv[1:]
+    entry = daemon if "--daemon" in args else main
+    entry(pipeline="--pipeline" in args, batch="--batch" in args)
@@ -1,39 +1,281 @@
-import requests
+import hashlib
 import json
+import os
 import re
-import random
-from .config import WRITER_PROMPT, CRITIC_PROMPT, GEMINI_API_KEY
+import threading
+from .config import WRITER_PROMPT, CRITIC_PROMPT, GEMINI_API_KEY, GEMINI_API_BASE, HTTP_CONNECT_TIMEOUT
+from . import http_client
+from .model_registry import resolve_model_names
+from . import metrics
+from .model_health import rank_models, record_success, record_failure, cooldown_remaining, seconds_until_quota_reset
 
 # Verified models from API check
 # Switching to 'Lite' models to bypass rate limits on standard/pro models
 MODEL_NAMES = ["gemini-2.5-flash-lite", "gemini-flash-lite-latest", "gemini-2.0-flash-lite"]
 
+_resolved_model_names = None
+
+def get_model_names():
+    """MODEL_NAMES validated against the cached model registry (once per process)."""
+    global _resolved_model_names
+    if _resolved_model_names is None:
+        _resolved_model_names = resolve_model_names(MODEL_NAMES)
+    return _resolved_model_names
+
+def reset_model_names():
+    """Forgets the resolved list so long-running processes pick up registry changes."""
+    global _resolved_model_names
+    _resolved_model_names = None
+
 import time
 
-def call_gemini_api(model_name, prompt):
+# --- Rate limiting ---
+# Free-tier quotas per model (requests / tokens per minute). Kept slightly
+# below the published limits so we never trip the server-side counters.
+DEFAULT_RATE_LIMIT = {"rpm": 10, "tpm": 200000}
+MODEL_RATE_LIMITS = {
+    "gemini-2.0-flash-lite": {"rpm": 25, "tpm": 800000},
+}
+# Generation can legitimately take a while; this bounds a hung request
+GEMINI_READ_TIMEOUT = 60
+# A 429 asking us to wait longer than this moves on to the next model instead
+MAX_RATE_LIMIT_WAIT = 90
+
+
+class TokenBucket:
+    """Classic token bucket: holds up to `capacity`, refills continuously."""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+
+class ModelRateLimiter:
+    """
+    Per-model RPM + TPM buckets plus a hard "blocked until" set from 429s.
+    acquire() returns immediately when budget exists, otherwise sleeps
+    exactly until it does. Thread-safe.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = max(
+                    self.blocked_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(tokens, now),
+                )
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    return
+            time.sleep(wait)
+
+    def block_for(self, seconds):
+        """Called on 429: nobody may call this model for `seconds`."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            # The server says the window is spent; don't burst right after it
+            self.requests.tokens = min(self.requests.tokens, 0)
+
+    def adjust_tokens(self, delta):
+        """Corrects the token estimate once the real usage is known."""
+        with self.lock:
+            self.tokens.consume(delta)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(model_name):
+    with _rate_limiters_lock:
+        if model_name not in _rate_limiters:
+            limits = MODEL_RATE_LIMITS.get(model_name, DEFAULT_RATE_LIMIT)
+            _rate_limiters[model_name] = ModelRateLimiter(limits["rpm"], limits["tpm"])
+        return _rate_limiters[model_name]
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+def _parse_retry_delay(response):
+    """
+    Extracts how long to back off from a 429: the Retry-After header, or
+    the RetryInfo.retryDelay in Gemini's error details (e.g. "37s").
+    Returns (seconds or None, is_daily_quota).
+    """
+    delay = None
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            pass
+
+    daily = False
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except ValueError:
+        details = []
+    for detail in details:
+        detail_type = detail.get("@type", "")
+        if detail_type.endswith("RetryInfo") and delay is None:
+            match = re.match(r"([\d.]+)s", detail.get("retryDelay", ""))
+            if match:
+                delay = float(match.group(1))
+        elif detail_type.endswith("QuotaFailure"):
+            for violation in detail.get("violations", []):
+                if "PerDay" in violation.get("quotaId", ""):
+                    daily = True
+    return delay, daily
+
+# --- Response cache ---
+# Content-addressed cache of successful responses, keyed by (model, prompt).
+# Lets a retried run reuse the draft/critique of an article it already paid for.
+LLM_CACHE_FILE = "llm_cache.json"
+LLM_CACHE_TTL = 3 * 24 * 3600  # seconds
+LLM_CACHE_MAX_ENTRIES = 200
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def _cache_key(model_name, prompt):
+    return hashlib.sha256(f"{model_name}\n{prompt}".encode("utf-8")).hexdigest()
+
+def _evict_cache(cache, now):
+    """Drops expired entries, then the oldest ones beyond the size limit."""
+    for key in [k for k, v in cache.items() if now - v.get("created_at", 0) > LLM_CACHE_TTL]:
+        del cache[key]
+    if len(cache) > LLM_CACHE_MAX_ENTRIES:
+        by_age = sorted(cache, key=lambda k: cache[k].get("created_at", 0))
+        for key in by_age[:len(cache) - LLM_CACHE_MAX_ENTRIES]:
+            del cache[key]
+
+def _load_llm_cache():
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = {}
+        if os.path.exists(LLM_CACHE_FILE):
+            try:
+                with open(LLM_CACHE_FILE, "r", encoding="utf-8") as f:
+                    _llm_cache = json.load(f)
+            except json.JSONDecodeError:
+                pass
+        _evict_cache(_llm_cache, time.time())
+    return _llm_cache
+
+def get_cached_response(prompt, models):
+    """
+    Returns a cached response for `prompt` from any of `models`, or None.
+    Pass every configured model, not just the available ones: a model on
+    cooldown after a 429 is exactly the one whose answer is worth reusing.
+    """
+    with _llm_cache_lock:
+        cache = _load_llm_cache()
+        now = time.time()
+        for model_name in models:
+            entry = cache.get(_cache_key(model_name, prompt))
+            if entry and now - entry.get("created_at", 0) <= LLM_CACHE_TTL:
+                print(f"Using cached response from {model_name}")
+                metrics.incr("llm_cache_hits")
+                return entry["response"]
+    return None
+
+def cache_response(model_name, prompt, response_text):
+    with _llm_cache_lock:
+        cache = _load_llm_cache()
+        now = time.time()
+        cache[_cache_key(model_name, prompt)] = {
+            "model": model_name,
+            "created_at": now,
+            "response": response_text,
+        }
+        _evict_cache(cache, now)
+        with open(LLM_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=4, ensure_ascii=False)
+
+def call_gemini_api(model_name, prompt, generation_config=None):
     """
     Calls the Gemini REST API directly with robust error handling.
+    generation_config is passed through as-is (e.g. JSON response mode).
     """
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={GEMINI_API_KEY}"
+    url = f"{GEMINI_API_BASE}/models/{model_name}:generateContent?key={GEMINI_API_KEY}"
     headers = {'Content-Type': 'application/json'}
     data = {
         "contents": [{
             "parts": [{"text": prompt}]
         }]
     }
+    if generation_config:
+        data["generationConfig"] = generation_config
+
+    # Skip models that recently hit quota or disappeared (persisted across runs)
+    remaining = cooldown_remaining(model_name)
+    if remaining > 0:
+        # rank_models only offers a cooling model when all of them are; a
+        # short cooldown is then waited out rather than failing the call
+        all_cooling = all(cooldown_remaining(m) > 0 for m in get_model_names())
+        if not all_cooling or remaining > MAX_RATE_LIMIT_WAIT:
+            print(f"Skipping {model_name}: cooling down for {remaining:.0f}s more.")
+            return None
+        print(f"All models cooling down. Waiting {remaining:.0f}s for {model_name}...")
+        time.sleep(remaining)
     
     max_retries = 3  # Increase to 3 for reliability
+    limiter = get_rate_limiter(model_name)
+    estimated_tokens = estimate_tokens(prompt)
     
     for attempt in range(max_retries):
+        response = None  # never blame this attempt's failure on a previous response
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            # Blocks only as long as this model's RPM/TPM budget requires
+            with metrics.timer("rate_limit_wait", model=model_name):
+                limiter.acquire(estimated_tokens)
+            started = time.monotonic()
+            with metrics.timer("gemini_request", model=model_name):
+                response = http_client.post(url, headers=headers, json=data, timeout=(HTTP_CONNECT_TIMEOUT, GEMINI_READ_TIMEOUT))
+            latency = time.monotonic() - started
+            metrics.incr("gemini_calls")
             
             # Handle Rate Limiting (429)
             if response.status_code == 429:
-                if attempt < max_retries - 1:
+                metrics.incr("gemini_429")
+                wait_time, daily = _parse_retry_delay(response)
+                if daily:
+                    print(f"Daily quota exhausted for {model_name}. Trying next model...")
+                    record_failure(model_name, 429, daily_quota=True)
+                    limiter.block_for(seconds_until_quota_reset())
+                    return None
+                if wait_time is None:
                     wait_time = 30 * (attempt + 1) # 30s, 60s
-                    print(f"Rate limit hit for {model_name}. Waiting {wait_time}s before retry...")
-                    time.sleep(wait_time)
+                record_failure(model_name, 429, wait_time)
+                limiter.block_for(wait_time)
+                if attempt < max_retries - 1 and wait_time <= MAX_RATE_LIMIT_WAIT:
+                    print(f"Rate limit hit for {model_name}. Retrying in {wait_time:.0f}s...")
                     continue
                 else:
                     print(f"Rate limit hit for {model_name}. Trying next model...")
@@ -41,26 +283,34 @@ def call_gemini_api(model_name, prompt):
                 
             response.raise_for_status()
             result = response.json()
+
+            usage = result.get('usageMetadata', {})
+            metrics.record_usage(model_name, usage)
+            if usage.get('totalTokenCount'):
+                limiter.adjust_tokens(usage['totalTokenCount'] - estimated_tokens)
             
             # Extract text from response
             if 'candidates' in result and result['candidates']:
                 content = result['candidates'][0]['content']['parts'][0]['text']
+                record_success(model_name, latency)
                 return content
             else:
                 print(f"Unexpected response format from {model_name}: {result}")
+                record_failure(model_name)
                 return None
                 
         except Exception as e:
             print(f"Error calling {model_name} (Attempt {attempt+1}/{max_retries}): {e}")
+            record_failure(model_name, response.status_code if response is not None else None)
             try:
                 # Check if response object exists before accessing status_code
-                if 'response' in locals() and response.status_code != 200:
+                if response is not None and response.status_code != 200:
                      print(f"Response: {response.text}")
             except:
                 pass
             
             # Don't retry on client errors (400, 404, etc) except 429 which is handled above
-            if 'response' in locals() and 400 <= response.status_code < 500 and response.status_code != 429:
+            if response is not None and 400 <= response.status_code < 500 and response.status_code != 429:
                 return None
             
             # Retry on server errors or connection issues
@@ -73,44 +323,172 @@ def generate_post(article_text):
     """
     Generates a draft post using Gemini, trying multiple models via REST API.
     """
-    # Roulette: Shuffle models to distribute load and avoid hitting limits on the first one
-    models_to_try = MODEL_NAMES.copy()
-    random.shuffle(models_to_try)
+    # Healthiest, fastest models first; cooled-down ones are skipped
+    models_to_try = rank_models(get_model_names())
+
+    full_prompt = f"{WRITER_PROMPT}\n\nТекст статьи:\n{article_text}"
+    cached = get_cached_response(full_prompt, get_model_names())
+    if cached:
+        return cached.strip()
     
     for model_name in models_to_try:
-        full_prompt = f"{WRITER_PROMPT}\n\nТекст статьи:\n{article_text}"
         result = call_gemini_api(model_name, full_prompt)
         if result:
             print(f"Successfully generated using {model_name}")
+            cache_response(model_name, full_prompt, result)
             return result.strip()
             
     print("All models failed to generate post.")
     return None
 
+def _read_score(text_score):
+    """The 0-10 score in a critic reply, or None if there is none."""
+    match = re.search(r'\d+', text_score)
+    if match:
+        score = int(match.group())
+        if 0 <= score <= 10:
+            return score
+        # If score is somehow > 10 (e.g. 1000/10), it's likely a parsing error or hallucination.
+    return None
+
 def critique_post(draft_post):
     """
     Critiques the draft post and returns a score (0-10).
     """
-    # Roulette here too
-    models_to_try = MODEL_NAMES.copy()
-    random.shuffle(models_to_try)
+    models_to_try = rank_models(get_model_names())
+
+    full_prompt = f"{CRITIC_PROMPT}\n\nЧерновик поста:\n{draft_post}"
+    cached = get_cached_response(full_prompt, get_model_names())
+    if cached and _read_score(cached) is not None:
+        return _read_score(cached)
     
     for model_name in models_to_try:
-        full_prompt = f"{CRITIC_PROMPT}\n\nЧерновик поста:\n{draft_post}"
         result = call_gemini_api(model_name, full_prompt)
         if result:
-            text_score = result.strip()
-            # Parse the score
-            # Parse the score
-            match = re.search(r'\d+', text_score)
-            if match:
-                score = int(match.group())
-                if 0 <= score <= 10:
-                    return score
-                # If score is somehow > 10 (e.g. 1000/10), it's likely a parsing error or hallucination.
-                # Return 0 to be safe
+            score = _read_score(result.strip())
+            if score is None:
+                # Not cached: a 0 replayed for days would block the retry
+                print(f"Unreadable score from {model_name}: {result.strip()[:50]!r}")
                 return 0
-            return 0
+            cache_response(model_name, full_prompt, result)
+            return score
             
     print("All models failed to critique post.")
     return 0
+
+# --- Batch mode ---
+# One request per batch instead of per article: the multi-kilobyte prompts
+# are sent once and request-count quotas stop being the bottleneck.
+BATCH_SIZE = 5
+JSON_RESPONSE_CONFIG = {"responseMimeType": "application/json"}
+
+BATCH_WRITER_INSTRUCTIONS = """
+РЕЖИМ ПАКЕТА: ниже несколько статей, у каждой есть id.
+Для КАЖДОЙ статьи напиши пост по формату выше (или SKIP по тем же правилам).
+Верни только JSON-массив без пояснений:
+[{"id": "<id статьи>", "post": "<текст поста или SKIP>"}]
+"""
+
+BATCH_CRITIC_INSTRUCTIONS = """
+РЕЖИМ ПАКЕТА: ниже несколько черновиков, у каждого есть id.
+Оцени КАЖДЫЙ черновик по шкале выше.
+Верни только JSON-массив без пояснений:
+[{"id": "<id черновика>", "score": <число 0-10>}]
+"""
+
+def parse_json_response(text):
+    """
+    Parses a JSON model response, tolerating ```json fences and stray
+    text around the payload. Returns None when nothing parseable is found.
+    """
+    text = text.strip()
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    for open_char, close_char in (("[", "]"), ("{", "}")):
+        start, end = text.find(open_char), text.rfind(close_char)
+        if start != -1 and end > start:
+            try:
+                return json.loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                continue
+    return None
+
+def _items_by_id(parsed, value_key):
+    """Maps id -> value from a [{"id":..., value_key:...}] response; bad items are skipped."""
+    results = {}
+    if isinstance(parsed, dict):
+        parsed = parsed.get("items") or parsed.get("results") or [parsed]
+    if not isinstance(parsed, list):
+        return results
+    for item in parsed:
+        if isinstance(item, dict) and "id" in item and item.get(value_key) is not None:
+            results[str(item["id"])] = item[value_key]
+    return results
+
+def _call_batch(prompt, value_key):
+    models_to_try = rank_models(get_model_names())
+
+    cached = get_cached_response(prompt, get_model_names())
+    if cached:
+        return _items_by_id(parse_json_response(cached), value_key)
+
+    for model_name in models_to_try:
+        result = call_gemini_api(model_name, prompt, JSON_RESPONSE_CONFIG)
+        if not result:
+            continue
+        items = _items_by_id(parse_json_response(result), value_key)
+        if items:
+            print(f"Batch of {len(items)} handled by {model_name}")
+            cache_response(model_name, prompt, result)
+            return items
+        print(f"Unparseable batch response from {model_name}. Trying next model...")
+    return {}
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield i, items[i:i + size]
+
+def generate_posts_batch(article_texts, fallback=True):
+    """
+    Drafts several articles per request. Returns drafts in input order;
+    items missing from the batch response are retried one by one with
+    generate_post when fallback=True, otherwise left as None.
+    """
+    drafts = [None] * len(article_texts)
+    for offset, chunk in _chunks(article_texts, BATCH_SIZE):
+        articles_block = "\n\n".join(f"### id: {i}\n{text}" for i, text in enumerate(chunk))
+        prompt = f"{WRITER_PROMPT}\n{BATCH_WRITER_INSTRUCTIONS}\n\nСтатьи:\n{articles_block}"
+        items = _call_batch(prompt, "post")
+        for i in range(len(chunk)):
+            post = items.get(str(i))
+            if isinstance(post, str) and post.strip():
+                drafts[offset + i] = post.strip()
+
+    for i, draft in enumerate(drafts):
+        if draft is None and fallback:
+            print(f"Batch item {i} missing. Falling back to single request...")
+            drafts[i] = generate_post(article_texts[i])
+    return drafts
+
+def critique_posts_batch(drafts, fallback=True):
+    """
+    Scores several drafts per request. Returns scores (0-10) in input order;
+    missing items fall back to critique_post, or score 0 without fallback.
+    """
+    scores = [None] * len(drafts)
+    for offset, chunk in _chunks(drafts, BATCH_SIZE):
+        drafts_block = "\n\n".join(f"### id: {i}\n{draft}" for i, draft in enumerate(chunk))
+        prompt = f"{CRITIC_PROMPT}\n{BATCH_CRITIC_INSTRUCTIONS}\n\nЧерновики:\n{drafts_block}"
+        items = _call_batch(prompt, "score")
+        for i in range(len(chunk)):
+            if str(i) in items:
+                # Unreadable scores stay None and fall back like missing ones
+                scores[offset + i] = _read_score(str(items[str(i)]))
+
+    for i, score in enumerate(scores):
+        if score is None:
+            scores[i] = critique_post(drafts[i]) if fallback else 0
+    return scores
@@ -7,6 +7,10 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID")
 
+# API endpoints; overridable so benchmarks can point at local stand-ins
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+
 RSS_FEEDS = [
     "https://www.reddit.com/r/nocode/.rss",
     "https://www.reddit.com/r/saas/.rss",
@@ -17,6 +21,30 @@ RSS_FEEDS = [
     "https://dev.to/feed/tag/nocode"
 ]
 
+# Shared HTTP client (src/http_client.py): pooled keep-alive connections
+HTTP_CONNECT_TIMEOUT = 5   # seconds
+HTTP_READ_TIMEOUT = 30     # seconds
+HTTP_POOL_SIZE = 10        # connections kept per host
+
+# Feed fetching: feeds are downloaded in parallel over one pooled session.
+# Reddit throttles aggressively, so concurrent requests per host are capped.
+FEED_FETCH_WORKERS = 4
+FEED_MAX_PER_HOST = 2
+FEED_TIMEOUT = 15  # seconds, per feed
+FEED_USER_AGENT = "TheBuilderBot/1.5 (+https://github.com/vladmarketolog-bot/AI-blog-tg)"
+
+# Limit the number of articles to CHECK and PUBLISH per run
+# 'MAX_CHECKED' limits API usage (don't burn all credits on junk)
+# 'MAX_PUBLISHED' ensures we don't spam the channel
+MAX_ARTICLES_TO_CHECK = 5
+MAX_ARTICLES_TO_PUBLISH = 1
+# Scraping stops once this many fresh candidates are collected for ranking
+CANDIDATE_POOL_SIZE = 15
+
+# Pipeline mode (main.py --pipeline): concurrent workers per stage.
+# Gemini quotas are still enforced by the per-model rate limiter.
+PIPELINE_WORKERS = 3
+
 # Prompt for the Writer
 # Prompt for the Writer
 WRITER_PROMPT = """
@@ -0,0 +1,216 @@
+"""
+Long-running scheduler: one warm process instead of a cold cron run per slot.
+
+Between publishing slots the daemon polls feeds into a candidate pool,
+each one whenever its adaptive interval says it is due (see
+scraper.feed_poll_interval). At each slot the pool goes through the usual
+dedupe → rank → AI review → publish path, and on Sunday the weekly digest
+goes out. HTTP pools, the history index, rate limiters and the LLM cache
+stay warm across slots.
+
+The pool and the last handled slots are checkpointed to daemon_state.json
+after every poll, so a restart resumes with the candidates of feeds that
+are not due again yet. A slot missed by less than SLOT_GRACE is caught up,
+an older one is skipped.
+"""
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .config import RSS_FEEDS
+from .scraper import iter_feeds, next_feed_due_in
+from .utils import is_url_processed, load_feed_state
+from .urls import canonicalize_url
+from .ai_engine import reset_model_names
+from .model_registry import get_cached_models
+from .publisher import start_drainer, stop_drainer
+from .digest import build_and_send_digest
+from .pipeline import record_published, queued_links
+from . import metrics
+
+DAEMON_STATE_FILE = "daemon_state.json"
+
+# UTC, same slots as .github/workflows/schedule.yml and weekly_digest.yml
+PUBLISH_SLOTS = ["05:00", "09:30", "13:30", "17:00"]
+DIGEST_SLOTS = ["09:00"]
+DIGEST_WEEKDAY = 6  # Sunday
+# A slot missed by more than this (daemon was down) is skipped, not caught up
+SLOT_GRACE = 3600
+
+# Lower bound on the sleep between polls, however soon the next feed is due
+POLL_MIN_SLEEP = 60
+
+# Unpublished candidates are kept for later slots, within limits
+POOL_MAX_SIZE = 100
+POOL_MAX_AGE = 2 * 24 * 3600
+
+# How long shutdown waits for queued posts to be delivered
+PUBLISH_DRAIN_TIMEOUT = 300
+
+
+def load_checkpoint():
+    if not os.path.exists(DAEMON_STATE_FILE):
+        return {}
+    try:
+        with open(DAEMON_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+
+def save_checkpoint(state):
+    # Write-then-rename so a crash mid-write never leaves a truncated checkpoint
+    tmp_path = DAEMON_STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, DAEMON_STATE_FILE)
+
+
+def _slot_datetimes(day, slots):
+    for slot in slots:
+        hour, minute = map(int, slot.split(":"))
+        yield datetime(day.year, day.month, day.day, hour, minute)
+
+
+def last_slot(now, slots, weekday=None):
+    """Most recent slot at or before `now` (naive UTC), or None within the past week."""
+    for days_back in range(8):
+        day = now - timedelta(days=days_back)
+        if weekday is not None and day.weekday() != weekday:
+            continue
+        past = [t for t in _slot_datetimes(day, slots) if t <= now]
+        if past:
+            return max(past)
+    return None
+
+
+def next_slot(now, slots, weekday=None):
+    """First slot strictly after `now` (naive UTC)."""
+    for days_ahead in range(8):
+        day = now + timedelta(days=days_ahead)
+        if weekday is not None and day.weekday() != weekday:
+            continue
+        upcoming = [t for t in _slot_datetimes(day, slots) if t > now]
+        if upcoming:
+            return min(upcoming)
+    return None
+
+
+def is_slot_due(now, slot, last_done):
+    """True if `slot` has not been handled yet and was missed by at most SLOT_GRACE."""
+    if slot is None:
+        return False
+    if last_done and datetime.fromisoformat(last_done) >= slot:
+        return False
+    return (now - slot).total_seconds() <= SLOT_GRACE
+
+
+def prune_pool(pool, now=None):
+    """Drops processed, stale and excess candidates (oldest first)."""
+    now = now or time.time()
+    kept = [
+        a for a in pool
+        if now - a.get("pooled_at", now) <= POOL_MAX_AGE and not is_url_processed(a['link'])
+    ]
+    return kept[-POOL_MAX_SIZE:]
+
+
+def poll_feeds(pool):
+    """Fetches the feeds that are due into `pool`; returns how many new candidates were added."""
+    known = {canonicalize_url(a['link']) for a in pool}
+    added = 0
+    with metrics.timer("scrape"):
+        for article in iter_feeds(RSS_FEEDS, only_due=True):
+            canonical = canonicalize_url(article['link'])
+            if canonical in known or is_url_processed(article['link']):
+                continue
+            known.add(canonical)
+            article["pooled_at"] = time.time()
+            pool.append(article)
+            added += 1
+    metrics.incr("articles_scraped", added)
+    return added
+
+
+def _run_publish_slot(process, pool):
+    # Pick up model list changes; a stale cache refreshes in the background
+    get_cached_models()
+    reset_model_names()
+    # Posts still waiting in the outbox keep their article in the pool (it
+    # comes back if delivery fails for good) but out of this slot
+    queued = queued_links()
+    candidates = [a for a in prune_pool(pool) if canonicalize_url(a['link']) not in queued]
+    print(f"Publishing slot: {len(candidates)} pooled candidates.")
+    with metrics.timer("run"):
+        published = process(candidates)
+    if not published:
+        print("No new qualified articles found/published this slot.")
+    metrics.write_summary()
+    metrics.reset()
+
+
+def run_daemon(process, stop_event=None):
+    """
+    Runs until SIGINT/SIGTERM (or `stop_event` is set). `process` takes a
+    list of candidate articles and returns how many were published.
+    """
+    stop = stop_event or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    state = load_checkpoint()
+    pool = state.get("pool", [])
+    print(f"Daemon started: {len(pool)} pooled candidates restored, slots {', '.join(PUBLISH_SLOTS)} UTC.")
+
+    start_drainer(on_sent=record_published)
+    try:
+        while not stop.is_set():
+            try:
+                poll_feeds(pool)
+            except Exception as e:
+                # A poll failure must not take the scheduler down; try again later
+                print(f"Feed poll failed: {e}")
+            pool[:] = prune_pool(pool)
+
+            now = datetime.utcnow()
+            slot = last_slot(now, PUBLISH_SLOTS)
+            if is_slot_due(now, slot, state.get("last_publish_slot")):
+                try:
+                    _run_publish_slot(process, pool)
+                    # Left unmarked on failure, so the slot is retried within SLOT_GRACE
+                    state["last_publish_slot"] = slot.isoformat()
+                except Exception as e:
+                    print(f"Publish slot failed: {e}")
+                pool[:] = prune_pool(pool)
+
+            slot = last_slot(now, DIGEST_SLOTS, DIGEST_WEEKDAY)
+            if is_slot_due(now, slot, state.get("last_digest_slot")):
+                try:
+                    build_and_send_digest()
+                    state["last_digest_slot"] = slot.isoformat()
+                except Exception as e:
+                    print(f"Digest failed: {e}")
+
+            state["pool"] = pool
+            save_checkpoint(state)
+
+            # Sleep until the next feed is due, but wake up for the next slot
+            now = datetime.utcnow()
+            poll_in = max(POLL_MIN_SLEEP, next_feed_due_in(RSS_FEEDS, load_feed_state()))
+            wake = min(
+                now + timedelta(seconds=poll_in),
+                next_slot(now, PUBLISH_SLOTS),
+                next_slot(now, DIGEST_SLOTS, DIGEST_WEEKDAY),
+            )
+            print(f"Pool: {len(pool)} candidates. Next wake-up at {wake.strftime('%H:%M:%S')} UTC.")
+            stop.wait(max(1.0, (wake - now).total_seconds()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Daemon stopping: checkpointing and draining the outbox...")
+        state["pool"] = pool
+        save_checkpoint(state)
+        stop_drainer(timeout=PUBLISH_DRAIN_TIMEOUT)
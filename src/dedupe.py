@@ -0,0 +1,134 @@
+"""
+Near-duplicate detection via 64-bit SimHash signatures.
+
+The same launch is often cross-posted to several subreddits, Indie Hackers
+and Product Hunt under different URLs. Every article added to history also
+gets a SimHash of its normalized title + summary; new candidates within
+NEAR_DUPLICATE_MAX_DISTANCE bits of a stored signature are skipped.
+
+Lookups use the pigeonhole trick: with d allowed differing bits the 64-bit
+signature is split into d + 1 bands, and any match must agree exactly on at
+least one band, so only signatures sharing a band value are compared.
+"""
+import hashlib
+import os
+import re
+
+SIGNATURES_FILE = "signatures.txt"
+# Max differing bits (out of 64) for two articles to count as the same story
+NEAR_DUPLICATE_MAX_DISTANCE = 3
+SHINGLE_SIZE = 3
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WORD_RE = re.compile(r"\w+")
+# Reddit RSS boilerplate that would otherwise make all posts look alike
+_BOILERPLATE_RE = re.compile(r"submitted by\s+/u/\S+|\[link\]|\[comments\]", re.IGNORECASE)
+
+
+def _normalize(title, summary):
+    text = f"{title} {summary}"
+    text = _TAG_RE.sub(" ", text)
+    text = _BOILERPLATE_RE.sub(" ", text)
+    return _WORD_RE.findall(text.lower())
+
+
+def simhash(title, summary=""):
+    """64-bit SimHash over word shingles of the normalized text."""
+    words = _normalize(title, summary)
+    if len(words) >= SHINGLE_SIZE:
+        features = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    else:
+        features = [" ".join(words)]
+
+    weights = [0] * 64
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    signature = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            signature |= 1 << bit
+    return signature
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SignatureIndex:
+    """Banded in-memory index of SimHash signatures."""
+
+    def __init__(self, max_distance=NEAR_DUPLICATE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.buckets = {}
+        self.size = 0
+
+    def _band_keys(self, signature):
+        mask = (1 << self.band_bits) - 1
+        return [(i, (signature >> (i * self.band_bits)) & mask) for i in range(self.bands)]
+
+    def add(self, signature):
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, []).append(signature)
+        self.size += 1
+
+    def find(self, signature):
+        """Returns a stored signature within max_distance, or None."""
+        for key in self._band_keys(signature):
+            for candidate in self.buckets.get(key, ()):
+                if hamming_distance(signature, candidate) <= self.max_distance:
+                    return candidate
+        return None
+
+
+_index = None
+
+
+def _load_index():
+    global _index
+    if _index is None:
+        _index = SignatureIndex()
+        if os.path.exists(SIGNATURES_FILE):
+            with open(SIGNATURES_FILE, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        _index.add(int(line, 16))
+    return _index
+
+
+def is_near_duplicate(title, summary=""):
+    return _load_index().find(simhash(title, summary)) is not None
+
+
+def add_signature(title, summary=""):
+    """Records an article's signature (append-only, one hex value per line)."""
+    signature = simhash(title, summary)
+    index = _load_index()
+    if index.find(signature) == signature:
+        return
+    index.add(signature)
+    with open(SIGNATURES_FILE, "a", encoding="utf-8") as f:
+        f.write(f"{signature:016x}\n")
+
+
+def filter_near_duplicates(articles):
+    """
+    Drops articles that match the stored index or an earlier article in the
+    same batch (cross-posts scraped in one run).
+    """
+    index = _load_index()
+    batch = SignatureIndex(index.max_distance)
+    result = []
+    for article in articles:
+        signature = simhash(article['title'], article.get('summary', ''))
+        if index.find(signature) is not None or batch.find(signature) is not None:
+            print(f"Skipping (Near-duplicate): {article['title']}")
+            continue
+        batch.add(signature)
+        result.append(article)
+    return result
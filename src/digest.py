@@ -1,22 +1,41 @@
-import time
-import random
+import re
 from datetime import datetime, timedelta
 from .utils import get_weekly_digest_entries
-from .ai_engine import call_gemini_api, MODEL_NAMES
+from .ai_engine import call_gemini_api, get_model_names, parse_json_response, JSON_RESPONSE_CONFIG
+from .model_health import rank_models
 from .publisher import send_post
 
 
 DIGEST_PROMPT = """
 Ты — редактор Telegram-канала для инди-хакеров и No-code билдеров.
 
-Тебе дан список статей, опубликованных за неделю. Для каждой статьи напиши ровно 1 строку — краткий, живой анонс без воды.
+Тебе дан список статей, опубликованных за неделю, у каждой есть id. Для каждой статьи напиши ровно 1 строку — краткий, живой анонс без воды.
+Одна строка сути, 10-15 слов. Цифры приветствуются. Без "уникальный", "потрясающий".
 
-Формат для каждой статьи:
-→ [одна строка сути, 10-15 слов. Цифры приветствуются. Без "уникальный", "потрясающий"]
-
-Верни только аннотации в нужном порядке, без лишних слов.
+Верни только JSON-массив без пояснений:
+[{"id": "<id статьи>", "annotation": "<одна строка>"}]
 """
 
+FALLBACK_ANNOTATION = "Интересный кейс — читай по ссылке."
+
+
+def headline_annotation(draft_post):
+    """
+    One-line digest annotation taken from the draft's headline
+    (`Название | Суть | Метрика`), so publishing already pays for it.
+    Returns None when the draft has no usable headline.
+    """
+    for line in draft_post.splitlines():
+        line = re.sub(r"[*_`\[\]]", "", line).strip()
+        if not line:
+            continue
+        if line.upper().startswith("SKIP"):
+            return None
+        parts = [p.strip() for p in line.split("|") if p.strip()]
+        # Drop the product name: the digest already shows the article title
+        return " · ".join(parts[1:] if len(parts) > 1 else parts)[:150] or None
+    return None
+
 
 def _get_week_range_str():
     """Returns a human-readable week range string, e.g. '17–23 февраля'."""
@@ -32,21 +51,30 @@ def _get_week_range_str():
 
 
 def _generate_annotations(entries):
-    """Asks AI to generate one-line annotations for each entry."""
-    articles_text = "\n".join(
-        [f"{i+1}. {e['title']}" for i, e in enumerate(entries)]
-    )
+    """
+    Asks AI for annotations of `entries` in one JSON-mode call.
+    Returns {entry_id: annotation}; entries the model skipped are absent.
+    """
+    articles_text = "\n".join(f"### id: {e['id']}\n{e['title']}" for e in entries)
     prompt = f"{DIGEST_PROMPT}\n\nСписок статей:\n{articles_text}"
 
-    models = MODEL_NAMES.copy()
-    random.shuffle(models)
-
-    for model in models:
-        result = call_gemini_api(model, prompt)
-        if result:
-            return result.strip()
-
-    return None
+    for model in rank_models(get_model_names()):
+        result = call_gemini_api(model, prompt, JSON_RESPONSE_CONFIG)
+        if not result:
+            continue
+        parsed = parse_json_response(result)
+        if isinstance(parsed, dict):
+            parsed = parsed.get("items") or [parsed]
+        annotations = {
+            str(item["id"]): str(item["annotation"]).strip().lstrip("→").strip()
+            for item in parsed or []
+            if isinstance(item, dict) and item.get("id") is not None and item.get("annotation")
+        }
+        if annotations:
+            return annotations
+        print(f"Unparseable annotations from {model}. Trying next model...")
+
+    return {}
 
 
 def _number_emoji(n):
@@ -68,19 +96,18 @@ def build_and_send_digest():
 
     print(f"Found {len(entries)} articles for this week's digest.")
 
-    # Generate AI annotations
-    print("Generating AI annotations...")
-    annotations_raw = _generate_annotations(entries)
-
-    # Parse annotation lines (one per entry)
-    if annotations_raw:
-        lines = [l.strip().lstrip("→").strip() for l in annotations_raw.splitlines() if l.strip()]
-        # Pad or trim to match entry count
-        while len(lines) < len(entries):
-            lines.append("Интересный кейс — читай по ссылке.")
-        lines = lines[:len(entries)]
-    else:
-        lines = ["Интересный кейс — читай по ссылке."] * len(entries)
+    # Annotations cached at publish time are reused; at most one call covers the rest
+    # (entries migrated from digest.json have no id; their position stands in)
+    keyed = [dict(e, id=str(e.get("id") or i)) for i, e in enumerate(entries)]
+    missing = [e for e in keyed if not e.get("annotation")]
+    generated = {}
+    if missing:
+        print(f"Generating AI annotations for {len(missing)} entries...")
+        generated = _generate_annotations(missing)
+    lines = [
+        e.get("annotation") or generated.get(e["id"]) or FALLBACK_ANNOTATION
+        for e in keyed
+    ]
 
     # Build the digest post
     week_str = _get_week_range_str()
@@ -0,0 +1,70 @@
+"""
+Shared HTTP client for every outbound call (feeds, Gemini, Telegram).
+
+One pooled requests.Session per process keeps TCP+TLS connections alive
+between calls, and every request gets explicit connect/read timeouts so a
+hung server can't stall a run until the workflow timeout.
+
+requests speaks HTTP/1.1 only; keep-alive pooling gives most of the
+latency win HTTP/2 would for the handful of hosts we talk to.
+"""
+import threading
+from .config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+# Transport-level retries: connection failures always (nothing was sent),
+# gateway errors only for idempotent methods. 429s are left to callers,
+# which know the service-specific backoff rules. Kept as urllib3 Retry
+# kwargs: requests itself is only imported once a session is needed.
+RETRY_POLICY = dict(
+    total=3,
+    connect=2,
+    read=0,
+    status=2,
+    status_forcelist=(502, 503, 504),
+    allowed_methods=frozenset({"GET", "HEAD"}),
+    backoff_factor=0.5,
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Returns the process-wide pooled session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=Retry(**RETRY_POLICY))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def request(method, url, timeout=None, **kwargs):
+    """session.request with the default (connect, read) timeout applied."""
+    return get_session().request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
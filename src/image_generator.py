@@ -1,76 +1,198 @@
 from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import hashlib
+import io
 import textwrap
 import os
 
 TEMPLATE_PATH = "template.png"
-COVER_OUTPUT = "cover.jpg"
+# Covers are written to content-hashed files, so identical inputs render once
+# and concurrent renders never clobber each other's output.
+COVER_DIR = "covers"
+COVER_CACHE_MAX_FILES = 50
 
-def create_cover(title, tools, revenue=""):
+# Encoding: "JPEG", "WEBP" or "PNG" (lossless, ignores quality). Quality steps down until the cover fits
+# COVER_MAX_BYTES (Telegram allows 10 MB, but smaller uploads are faster).
+COVER_FORMAT = "JPEG"
+COVER_QUALITY = 85
+COVER_MIN_QUALITY = 40
+COVER_MAX_BYTES = 300 * 1024
+# Telegram shows channel photos at roughly this width; set as display_size
+# to render on a pre-shrunk template instead of the full-size one.
+COVER_DISPLAY_SIZE = 800
+
+@lru_cache(maxsize=2)
+def _load_template(mtime, size=None):
+    """
+    Decoded template, kept resident; keyed by mtime so edits are picked up.
+    With `size`, the template is pre-shrunk to size×size once.
+    """
+    img = Image.open(TEMPLATE_PATH)
+    img.load()
+    if size and img.size != (size, size):
+        img = img.resize((size, size), Image.LANCZOS)
+    return img
+
+@lru_cache(maxsize=4)
+def _load_fonts(scale=1.0):
+    # Load font - try to load a system font or default
+    try:
+         # Try standard fonts
+        return {
+            "title": ImageFont.truetype("arial.ttf", round(60 * scale)),
+            "tools": ImageFont.truetype("arial.ttf", round(40 * scale)),
+            "metric": ImageFont.truetype("arialbd.ttf", round(50 * scale)),  # Bold for metrics
+            "metric_label": ImageFont.truetype("arial.ttf", round(30 * scale)),
+        }
+    except IOError:
+        default = ImageFont.load_default()
+        return {"title": default, "tools": default, "metric": default, "metric_label": default}
+
+def _text_size(text, font):
+    bbox = font.getbbox(text)
+    return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+@lru_cache(maxsize=256)
+def _title_layout(title, width, height, scale=1.0):
+    """Positions of the wrapped, centered title lines: ((x, y, line), ...)."""
+    font = _load_fonts(scale)["title"]
+    lines = textwrap.wrap(title, width=20)
+
+    positions = []
+    y_text = height / 2 - (len(lines) * 35 * scale)
+    for line in lines:
+        text_width, text_height = _text_size(line, font)
+        positions.append(((width - text_width) / 2, y_text, line))
+        y_text += text_height + 10 * scale
+    return tuple(positions)
+
+COVER_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+def _extension(fmt):
+    return COVER_EXTENSIONS.get(fmt.upper(), ".jpg")
+
+def _cover_path(title, tools, revenue, template_mtime, fmt=COVER_FORMAT, quality=COVER_QUALITY, display_size=None):
+    key = f"{title}\n{tools}\n{revenue}\n{template_mtime}\n{fmt}\n{quality}\n{display_size}".encode("utf-8")
+    return os.path.join(COVER_DIR, hashlib.sha256(key).hexdigest()[:16] + _extension(fmt))
+
+def encode_cover(img, fmt=COVER_FORMAT, quality=COVER_QUALITY, max_bytes=COVER_MAX_BYTES):
+    """
+    Encodes to an in-memory buffer, lowering quality until it fits max_bytes
+    (or COVER_MIN_QUALITY is reached). The buffer is rewound and named so
+    it can be uploaded as multipart directly.
+    """
+    while True:
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt, quality=quality)
+        # PNG is lossless: lowering quality would not shrink it
+        if buffer.tell() <= max_bytes or quality <= COVER_MIN_QUALITY or fmt.upper() == "PNG":
+            break
+        quality = max(COVER_MIN_QUALITY, quality - 10)
+    buffer.seek(0)
+    buffer.name = "cover" + _extension(fmt)
+    return buffer
+
+def _evict_old_covers():
+    """LRU on disk: keep the COVER_CACHE_MAX_FILES most recently used covers."""
+    covers = [os.path.join(COVER_DIR, name) for name in os.listdir(COVER_DIR) if name.endswith(tuple(COVER_EXTENSIONS.values()))]
+    if len(covers) <= COVER_CACHE_MAX_FILES:
+        return
+    covers.sort(key=os.path.getmtime)
+    for path in covers[:len(covers) - COVER_CACHE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _render(title, tools, revenue, template_mtime, display_size=None):
+    img = _load_template(template_mtime, display_size).copy()
+    draw = ImageDraw.Draw(img)
+    width, height = img.size
+    # Layout constants are in full-template pixels; a pre-shrunk template
+    # scales them by the same factor so both covers look alike
+    scale = width / _load_template(template_mtime).width if display_size else 1.0
+    fonts = _load_fonts(scale)
+
+    # Draw Title (Centered)
+    for x, y, line in _title_layout(title, width, height, scale):
+        draw.text((x, y), line, font=fonts["title"], fill="white")
+
+    # Draw Tools (Bottom)
+    tools_text = f"Tools: {tools}"
+    text_width, _ = _text_size(tools_text, fonts["tools"])
+    x_tools = (width - text_width) / 2
+    y_tools = height - round(100 * scale)
+
+    draw.text((x_tools, y_tools), tools_text, font=fonts["tools"], fill="white")
+
+    # Draw Metrics Card (Top-Right Corner) if revenue exists
+    if revenue:
+        card_width = round(280 * scale)
+        card_height = round(100 * scale)
+        card_x = width - card_width - round(30 * scale)
+        card_y = round(30 * scale)
+
+        # Semi-transparent background
+        overlay = Image.new('RGBA', (card_width, card_height), (0, 0, 0, 180))
+        img.paste(overlay, (card_x, card_y), overlay)
+
+        # Draw revenue text
+        draw.text((card_x + round(20 * scale), card_y + round(20 * scale)), "💰", font=fonts["metric"], fill="white")
+        draw.text((card_x + round(90 * scale), card_y + round(30 * scale)), revenue, font=fonts["metric_label"], fill="#00ff88")
+
+    return img.convert("RGB")
+
+def create_cover(title, tools, revenue="", in_memory=False, fmt=COVER_FORMAT, quality=COVER_QUALITY, display_size=None):
     """
     Generates a cover image based on the template with metrics overlay.
+    Returns the path of the (possibly cached) cover, or with in_memory=True
+    an encoded BytesIO buffer that send_post can upload without touching disk.
+    display_size renders on a template pre-shrunk to that many pixels.
     """
     if not os.path.exists(TEMPLATE_PATH):
         print(f"Template not found at {TEMPLATE_PATH}. Skipping image generation.")
         return None
 
     try:
-        img = Image.open(TEMPLATE_PATH)
-        draw = ImageDraw.Draw(img)
-        width, height = img.size
+        template_mtime = os.path.getmtime(TEMPLATE_PATH)
+        if in_memory:
+            img = _render(title, tools, revenue, template_mtime, display_size)
+            buffer = encode_cover(img, fmt, quality)
+            print(f"Cover image rendered in memory ({buffer.getbuffer().nbytes // 1024} KB)")
+            return buffer
 
-        # Load font - try to load a system font or default
-        try:
-             # Try standard fonts
-            title_font = ImageFont.truetype("arial.ttf", 60)
-            tools_font = ImageFont.truetype("arial.ttf", 40)
-            metric_font = ImageFont.truetype("arialbd.ttf", 50)  # Bold for metrics
-            metric_label_font = ImageFont.truetype("arial.ttf", 30)
-        except IOError:
-            title_font = ImageFont.load_default()
-            tools_font = ImageFont.load_default()
-            metric_font = ImageFont.load_default()
-            metric_label_font = ImageFont.load_default()
-
-        # Draw Title (Centered)
-        lines = textwrap.wrap(title, width=20)
-        
-        y_text = height / 2 - (len(lines) * 35)
-        for line in lines:
-            bbox = draw.textbbox((0, 0), line, font=title_font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            draw.text(((width - text_width) / 2, y_text), line, font=title_font, fill="white")
-            y_text += text_height + 10
-
-        # Draw Tools (Bottom)
-        tools_text = f"Tools: {tools}"
-        bbox = draw.textbbox((0, 0), tools_text, font=tools_font)
-        text_width = bbox[2] - bbox[0]
-        x_tools = (width - text_width) / 2
-        y_tools = height - 100
-        
-        draw.text((x_tools, y_tools), tools_text, font=tools_font, fill="white")
-
-        # Draw Metrics Card (Top-Right Corner) if revenue exists
-        if revenue:
-            card_width = 280
-            card_height = 100
-            card_x = width - card_width - 30
-            card_y = 30
-            
-            # Semi-transparent background
-            overlay = Image.new('RGBA', (card_width, card_height), (0, 0, 0, 180))
-            img.paste(overlay, (card_x, card_y), overlay)
-            
-            # Draw revenue text
-            draw.text((card_x + 20, card_y + 20), "💰", font=metric_font, fill="white")
-            draw.text((card_x + 90, card_y + 30), revenue, font=metric_label_font, fill="#00ff88")
-
-        img = img.convert("RGB")
-        img.save(COVER_OUTPUT)
-        print(f"Cover image saved to {COVER_OUTPUT}")
-        return COVER_OUTPUT
+        output_path = _cover_path(title, tools, revenue, template_mtime, fmt, quality, display_size)
+        if os.path.exists(output_path):
+            os.utime(output_path)  # mark as recently used
+            print(f"Cover image cached at {output_path}")
+            return output_path
+
+        img = _render(title, tools, revenue, template_mtime, display_size)
+        os.makedirs(COVER_DIR, exist_ok=True)
+        # Write-then-rename so a concurrent reader never sees a partial file
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encode_cover(img, fmt, quality).getbuffer())
+        os.replace(tmp_path, output_path)
+        _evict_old_covers()
+        print(f"Cover image saved to {output_path}")
+        return output_path
 
     except Exception as e:
         print(f"Error creating cover: {e}")
         return None
+
+def _create_cover_args(args):
+    return create_cover(*args)
+
+def render_covers(specs, workers=None):
+    """
+    Renders a batch of covers in a process pool.
+    specs: iterable of (title, tools, revenue) tuples. Returns paths in order.
+    """
+    specs = [tuple(spec) for spec in specs]
+    if len(specs) <= 1:
+        return [create_cover(*spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_create_cover_args, specs))
@@ -0,0 +1,133 @@
+"""
+Lightweight run instrumentation.
+
+Stage timers, counters and Gemini token usage, emitted as JSON lines
+(METRICS_FILE) and aggregated into a per-run summary (METRICS_SUMMARY_FILE)
+that the workflow uploads as an artifact. Disabled unless METRICS_ENABLED=1
+(or enable() is called); when disabled every call returns immediately.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+METRICS_FILE = "run_metrics.jsonl"
+METRICS_SUMMARY_FILE = "run_summary.json"
+
+_enabled = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_run_id = uuid.uuid4().hex[:12]
+_started_at = time.time()
+_timings = {}
+_counters = {}
+_tokens = {}
+_NULL_TIMER = nullcontext()
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Starts a new run (new run id, empty aggregates)."""
+    global _run_id, _started_at
+    with _lock:
+        _run_id = uuid.uuid4().hex[:12]
+        _started_at = time.time()
+        _timings.clear()
+        _counters.clear()
+        _tokens.clear()
+
+
+def emit(event, **fields):
+    """Appends one structured event to METRICS_FILE."""
+    if not _enabled:
+        return
+    record = {"run_id": _run_id, "ts": round(time.time(), 3), "event": event}
+    record.update(fields)
+    with _lock:
+        with open(METRICS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@contextmanager
+def _timer(stage, fields):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _timings.setdefault(stage, []).append(elapsed)
+        emit("timing", stage=stage, seconds=round(elapsed, 4), **fields)
+
+
+def timer(stage, **fields):
+    """`with timer("scrape"):` records the block's wall time under `stage`."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _timer(stage, fields)
+
+
+def incr(name, amount=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def record_usage(model_name, usage_metadata):
+    """Accumulates Gemini usageMetadata token counts per model."""
+    if not _enabled or not usage_metadata:
+        return
+    with _lock:
+        totals = _tokens.setdefault(model_name, {"prompt": 0, "candidates": 0, "total": 0})
+        totals["prompt"] += usage_metadata.get("promptTokenCount", 0)
+        totals["candidates"] += usage_metadata.get("candidatesTokenCount", 0)
+        totals["total"] += usage_metadata.get("totalTokenCount", 0)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summary():
+    with _lock:
+        stages = {
+            stage: {
+                "count": len(values),
+                "total": round(sum(values), 3),
+                "p50": round(_percentile(values, 50), 3),
+                "p95": round(_percentile(values, 95), 3),
+                "max": round(max(values), 3),
+            }
+            for stage, values in _timings.items()
+        }
+        return {
+            "run_id": _run_id,
+            "started_at": _started_at,
+            "duration": round(time.time() - _started_at, 3),
+            "stages": stages,
+            "counters": dict(_counters),
+            "tokens": {model: dict(totals) for model, totals in _tokens.items()},
+        }
+
+
+def write_summary(path=METRICS_SUMMARY_FILE):
+    """Writes the run summary (and emits it as a final event)."""
+    if not _enabled:
+        return None
+    data = summary()
+    emit("summary", **{k: v for k, v in data.items() if k != "run_id"})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    print(f"Run summary written to {path}")
+    return data
@@ -0,0 +1,144 @@
+"""
+Persistent model health registry.
+
+Tracks per-model success rate, latency percentiles, the last 429 and a
+cooldown window, persisted in model_health.json so the four daily cron
+runs share what earlier runs learned. rank_models() replaces the old
+random.shuffle roulette: healthy, fast models first, cooled-down ones
+skipped.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+MODEL_HEALTH_FILE = "model_health.json"
+LATENCY_WINDOW = 50  # recent latencies kept per model
+DEFAULT_429_COOLDOWN = 60  # seconds, when the server gives no retry delay
+NOT_FOUND_COOLDOWN = 24 * 3600  # 404: model retired or renamed
+# Gemini daily quotas reset at midnight Pacific time
+QUOTA_RESET_TZ = ZoneInfo("America/Los_Angeles")
+
+_health = None
+_lock = threading.Lock()
+
+
+def _load():
+    global _health
+    if _health is None:
+        _health = {}
+        if os.path.exists(MODEL_HEALTH_FILE):
+            try:
+                with open(MODEL_HEALTH_FILE, "r", encoding="utf-8") as f:
+                    _health = json.load(f)
+            except json.JSONDecodeError:
+                pass
+    return _health
+
+
+def _save():
+    with open(MODEL_HEALTH_FILE, "w", encoding="utf-8") as f:
+        json.dump(_health, f, indent=4)
+
+
+def _entry(model_name):
+    return _load().setdefault(model_name, {
+        "successes": 0,
+        "failures": 0,
+        "latencies": [],
+        "last_429": None,
+        "cooldown_until": 0,
+    })
+
+
+def seconds_until_quota_reset(now=None):
+    now = now or datetime.now(QUOTA_RESET_TZ)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+def record_success(model_name, latency):
+    with _lock:
+        entry = _entry(model_name)
+        entry["successes"] += 1
+        entry["latencies"] = (entry["latencies"] + [round(latency, 3)])[-LATENCY_WINDOW:]
+        _save()
+
+
+def record_failure(model_name, status_code=None, cooldown=None, daily_quota=False):
+    """
+    Records a failed call. 429s and 404s put the model on cooldown
+    (`cooldown` seconds if given, otherwise a default per status).
+    """
+    with _lock:
+        entry = _entry(model_name)
+        entry["failures"] += 1
+        now = time.time()
+        if status_code == 429:
+            entry["last_429"] = now
+            if daily_quota:
+                cooldown = seconds_until_quota_reset()
+            elif cooldown is None:
+                cooldown = DEFAULT_429_COOLDOWN
+        elif status_code == 404 and cooldown is None:
+            cooldown = NOT_FOUND_COOLDOWN
+        if cooldown:
+            entry["cooldown_until"] = max(entry.get("cooldown_until", 0), now + cooldown)
+        _save()
+
+
+def cooldown_remaining(model_name):
+    with _lock:
+        entry = _load().get(model_name)
+        if not entry:
+            return 0
+        return max(0, entry.get("cooldown_until", 0) - time.time())
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def model_stats(model_name):
+    """Success rate and latency percentiles for reporting."""
+    with _lock:
+        entry = dict(_entry(model_name))
+    calls = entry["successes"] + entry["failures"]
+    return {
+        "success_rate": entry["successes"] / calls if calls else None,
+        "p50": _percentile(entry["latencies"], 50),
+        "p95": _percentile(entry["latencies"], 95),
+        "cooldown_remaining": max(0, entry.get("cooldown_until", 0) - time.time()),
+        "last_429": entry.get("last_429"),
+    }
+
+
+def rank_models(model_names):
+    """
+    Orders models best first: available before cooled-down, then by
+    (smoothed) success rate, then by median latency. Cooled-down models are
+    dropped unless every model is cooling down, in which case they are
+    returned soonest-available first.
+    """
+    with _lock:
+        health = _load()
+        now = time.time()
+
+        def score(name):
+            entry = health.get(name, {})
+            successes = entry.get("successes", 0)
+            failures = entry.get("failures", 0)
+            # Laplace smoothing: unknown models start at 50% and get tried
+            success_rate = (successes + 1) / (successes + failures + 2)
+            p50 = _percentile(entry.get("latencies", []), 50)
+            return (-success_rate, p50 if p50 is not None else 0)
+
+        available = [m for m in model_names if health.get(m, {}).get("cooldown_until", 0) <= now]
+        if available:
+            return sorted(available, key=score)
+        return sorted(model_names, key=lambda m: health.get(m, {}).get("cooldown_until", 0))
@@ -0,0 +1,131 @@
+"""
+Cached Gemini model discovery.
+
+The model list changes rarely, so it is fetched at most once per
+MODELS_CACHE_TTL and stored in models_cache.json. check_models.py
+refreshes it explicitly; otherwise a stale cache is refreshed in a
+background thread while the run carries on with the cached copy, so
+discovery never sits on the startup path.
+"""
+import json
+import os
+import threading
+import time
+from . import http_client
+from .config import GEMINI_API_KEY, GEMINI_API_BASE
+
+MODELS_CACHE_FILE = "models_cache.json"
+MODELS_CACHE_TTL = 24 * 3600  # seconds
+MODELS_URL = f"{GEMINI_API_BASE}/models"
+# Used to auto-populate when none of the configured models are listed anymore
+PREFERRED_MODEL_MARKERS = ("flash-lite", "flash")
+
+_refresh_thread = None
+
+
+def _load_cache():
+    if not os.path.exists(MODELS_CACHE_FILE):
+        return None
+    try:
+        with open(MODELS_CACHE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return None
+
+
+def _save_cache(cache):
+    # Write-then-rename: a background refresh must never leave a torn file
+    tmp_path = MODELS_CACHE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=4)
+    os.replace(tmp_path, MODELS_CACHE_FILE)
+
+
+def fetch_models():
+    """
+    Lists models from the API and refreshes the cache.
+    Returns the model list; raises on HTTP errors.
+    """
+    models = []
+    page_token = None
+    while True:
+        params = {"key": GEMINI_API_KEY, "pageSize": 1000}
+        if page_token:
+            params["pageToken"] = page_token
+        response = http_client.get(MODELS_URL, params=params)
+        response.raise_for_status()
+        data = response.json()
+        for model in data.get("models", []):
+            models.append({
+                "name": model["name"].replace("models/", ""),
+                "methods": model.get("supportedGenerationMethods", []),
+                "input_token_limit": model.get("inputTokenLimit"),
+                "output_token_limit": model.get("outputTokenLimit"),
+            })
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            break
+
+    _save_cache({"fetched_at": time.time(), "models": models})
+    return models
+
+
+def _refresh_quietly():
+    try:
+        fetch_models()
+        print("Model list refreshed in background.")
+    except Exception as e:
+        print(f"Warning: Background model refresh failed: {e}")
+
+
+def refresh_in_background():
+    """Starts one background refresh per process (no-op if already running)."""
+    global _refresh_thread
+    if not GEMINI_API_KEY:
+        return
+    if _refresh_thread is None or not _refresh_thread.is_alive():
+        _refresh_thread = threading.Thread(target=_refresh_quietly, daemon=True)
+        _refresh_thread.start()
+
+
+def get_cached_models(refresh_if_stale=True):
+    """
+    Returns the cached model list (possibly stale) without blocking on the
+    network, or None if nothing was ever cached.
+    """
+    cache = _load_cache()
+    is_stale = not cache or time.time() - cache.get("fetched_at", 0) > MODELS_CACHE_TTL
+    if is_stale and refresh_if_stale:
+        refresh_in_background()
+    return cache["models"] if cache else None
+
+
+def generate_content_models(models):
+    return [m["name"] for m in models if "generateContent" in m.get("methods", [])]
+
+
+def resolve_model_names(configured):
+    """
+    Validates the configured model list against the cached capabilities.
+    Drops models that are gone or can't generateContent; if none survive,
+    falls back to the preferred available models. Without a cache the
+    configured list is returned unchanged.
+    """
+    models = get_cached_models()
+    if not models:
+        return list(configured)
+
+    available = generate_content_models(models)
+    valid = [name for name in configured if name in available]
+    dropped = [name for name in configured if name not in available]
+    if dropped:
+        print(f"Warning: Models not available for generateContent: {', '.join(dropped)}")
+    if valid:
+        return valid
+
+    for marker in PREFERRED_MODEL_MARKERS:
+        fallback = [name for name in available if marker in name][:3]
+        if fallback:
+            print(f"Auto-selected models: {', '.join(fallback)}")
+            return fallback
+    return list(configured)
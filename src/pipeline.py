@@ -0,0 +1,233 @@
+"""
+Asyncio pipeline: dedupe → generate → critique → publish.
+
+Candidates flow through bounded queues so drafting and critique of
+different articles overlap, while a single publisher enforces the
+"publish at most N" guarantee. Blocking calls (requests, file I/O in
+the AI engine) run in worker threads via asyncio.to_thread.
+"""
+import asyncio
+from .config import MAX_ARTICLES_TO_CHECK, MAX_ARTICLES_TO_PUBLISH, PIPELINE_WORKERS
+from .utils import is_url_processed, add_article_to_history, add_to_digest
+from .ai_engine import generate_post, critique_post, generate_posts_batch, critique_posts_batch
+from .publisher import enqueue_post, pending_posts
+from .urls import canonicalize_url
+from .scraper import record_feed_published
+from .digest import headline_annotation
+from . import metrics
+
+MIN_SCORE = 6
+# Drafts this long are published even if the critique call itself failed
+BYPASS_MIN_LENGTH = 500
+
+
+def build_article_content(article):
+    """Combine title and summary for better context."""
+    return f"Title: {article['title']}\nLink: {article['link']}\nSource: {article['source']}\nSummary: {article['summary']}"
+
+
+def is_skip_post(draft_post):
+    # Robust SKIP check: catches "SKIP", "SKIP.", "SKIP!", "skip", "SKIP\nпояснение..." etc.
+    return draft_post.strip().upper().startswith("SKIP")
+
+
+def is_critique_bypass(score, draft_post):
+    """
+    Emergency Bypass: If score is 0 (API failure) but draft is long enough, publish anyway.
+    Never bypass for SKIP posts (even long ones with explanations).
+    """
+    return score == 0 and len(draft_post) > BYPASS_MIN_LENGTH and not is_skip_post(draft_post)
+
+
+def publish_article(article, draft_post, image=None):
+    """
+    Queues the post in the durable outbox (the drainer delivers it).
+    Returns True once the post is safely queued; the article is recorded
+    by record_published only when the post is actually delivered.
+    """
+    meta = {
+        "article": {k: article.get(k) for k in ('title', 'link', 'summary', 'source')},
+        "annotation": headline_annotation(draft_post),
+    }
+    return bool(enqueue_post(draft_post, image, meta=meta))
+
+
+def record_published(post):
+    """
+    Drainer on_sent callback: marks a delivered post's article as processed,
+    adds it to the digest and credits its source feed.
+    """
+    meta = post.get("meta") or {}
+    article = meta.get("article")
+    if not article:
+        return
+    add_article_to_history(article)
+    add_to_digest(article['title'], article['link'], meta.get("annotation"))
+    record_feed_published(article.get('source'))
+    metrics.incr("published")
+
+
+def queued_links():
+    """Canonical links of articles whose posts are queued but not delivered yet."""
+    links = set()
+    for post in pending_posts():
+        article = (post.get("meta") or {}).get("article")
+        if article:
+            links.add(canonicalize_url(article['link']))
+    return links
+
+
+def select_candidates(articles, limit=MAX_ARTICLES_TO_CHECK):
+    """Dedupe stage: first `limit` articles not yet in history."""
+    candidates = []
+    for article in articles:
+        if len(candidates) >= limit:
+            break
+        if not is_url_processed(article['link']):
+            candidates.append(article)
+    return candidates
+
+
+async def _generate_worker(in_queue, out_queue, done):
+    while True:
+        article = await in_queue.get()
+        if article is None:
+            return
+        if done.is_set():
+            continue
+
+        print(f"[generate] {article['title']}")
+        draft_post = await asyncio.to_thread(generate_post, build_article_content(article))
+        if not draft_post:
+            print(f"[generate] Failed to generate draft: {article['title']}")
+            continue
+        if is_skip_post(draft_post):
+            print(f"🚫 [generate] AI skipped: {article['title']}")
+            add_article_to_history(article)
+            continue
+        await out_queue.put((article, draft_post))
+
+
+async def _critique_worker(in_queue, out_queue, done):
+    while True:
+        item = await in_queue.get()
+        if item is None:
+            return
+        if done.is_set():
+            continue
+
+        article, draft_post = item
+        score = await asyncio.to_thread(critique_post, draft_post)
+        print(f"[critique] {score}/10: {article['title']}")
+        if score < MIN_SCORE:
+            if is_critique_bypass(score, draft_post):
+                print("⚠️ Critique API failed (Rate Limit), but draft looks valid (>500 chars). PUBLISHING ANYWAY.")
+            else:
+                # Score 0 is likely an API error: leave it out of history to retry later
+                if score != 0:
+                    add_article_to_history(article)
+                continue
+        await out_queue.put((article, draft_post))
+
+
+async def _publish_worker(in_queue, done, max_publish):
+    published = []
+    while True:
+        item = await in_queue.get()
+        if item is None:
+            return published
+        if len(published) >= max_publish:
+            continue
+
+        article, draft_post = item
+        if publish_article(article, draft_post):
+            print(f"Queued for publishing: {article['title']}")
+            published.append(article)
+            if len(published) >= max_publish:
+                # Tell upstream stages to stop spending API calls
+                done.set()
+        else:
+            print("Failed to publish. Check BOT_TOKEN and CHANNEL_ID.")
+
+
+async def run_pipeline(articles, max_check=MAX_ARTICLES_TO_CHECK, max_publish=MAX_ARTICLES_TO_PUBLISH, workers=PIPELINE_WORKERS):
+    """
+    Processes up to `max_check` unprocessed candidates concurrently and
+    publishes at most `max_publish` of them. Returns the published articles.
+    """
+    candidates = select_candidates(articles, max_check)
+    print(f"Pipeline: {len(candidates)} candidates, {workers} workers per stage.")
+
+    done = asyncio.Event()
+    draft_queue = asyncio.Queue(maxsize=workers)
+    critique_queue = asyncio.Queue(maxsize=workers)
+    publish_queue = asyncio.Queue(maxsize=workers)
+
+    generators = [asyncio.create_task(_generate_worker(draft_queue, critique_queue, done)) for _ in range(workers)]
+    critics = [asyncio.create_task(_critique_worker(critique_queue, publish_queue, done)) for _ in range(workers)]
+    publisher = asyncio.create_task(_publish_worker(publish_queue, done, max_publish))
+
+    for article in candidates:
+        await draft_queue.put(article)
+
+    # Shut stages down in order: a None per worker drains each queue
+    for _ in generators:
+        await draft_queue.put(None)
+    await asyncio.gather(*generators)
+    for _ in critics:
+        await critique_queue.put(None)
+    await asyncio.gather(*critics)
+    await publish_queue.put(None)
+    return await publisher
+
+
+def run_pipeline_sync(articles, **kwargs):
+    return asyncio.run(run_pipeline(articles, **kwargs))
+
+
+def run_batch(articles, max_check=MAX_ARTICLES_TO_CHECK, max_publish=MAX_ARTICLES_TO_PUBLISH):
+    """
+    Triage mode: drafts all candidates in one request, critiques the
+    surviving drafts in a second one, then publishes the best-scoring
+    drafts (at most max_publish). Returns the published articles.
+    """
+    candidates = select_candidates(articles, max_check)
+    if not candidates:
+        return []
+    print(f"Batch: drafting {len(candidates)} candidates in one request...")
+    drafts = generate_posts_batch([build_article_content(a) for a in candidates])
+
+    drafted = []
+    for article, draft_post in zip(candidates, drafts):
+        if not draft_post:
+            print(f"Failed to generate draft: {article['title']}")
+        elif is_skip_post(draft_post):
+            print(f"🚫 AI skipped: {article['title']}")
+            add_article_to_history(article)
+        else:
+            drafted.append((article, draft_post))
+    if not drafted:
+        return []
+
+    print(f"Batch: critiquing {len(drafted)} drafts in one request...")
+    scores = critique_posts_batch([draft_post for _, draft_post in drafted])
+
+    approved = []
+    for (article, draft_post), score in zip(drafted, scores):
+        print(f"[critique] {score}/10: {article['title']}")
+        if score >= MIN_SCORE or is_critique_bypass(score, draft_post):
+            approved.append((score, article, draft_post))
+        elif score != 0:
+            add_article_to_history(article)
+
+    published = []
+    # Best first; bypassed drafts (score 0) come last
+    for score, article, draft_post in sorted(approved, key=lambda x: -x[0]):
+        if len(published) >= max_publish:
+            break
+        if publish_article(article, draft_post):
+            print(f"Queued for publishing: {article['title']}")
+            published.append(article)
+        else:
+            print("Failed to publish. Check BOT_TOKEN and CHANNEL_ID.")
+    return published
@@ -1,80 +1,506 @@
-import requests
-from .config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID
+from . import http_client
+from .config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID, TELEGRAM_API_BASE
+from . import metrics
+import base64
+import hashlib
+import html
+import io
+import json
 import os
+import re
+import threading
+import time
 
-def send_post(text, image_path):
+# Durable outbound queue: an append-only JSONL event log ("queued", "part_sent",
+# "attempt", "sent", "failed"). Posts are identified by a hash of their content, so
+# enqueueing or draining twice never double-posts.
+OUTBOX_FILE = "outbox.jsonl"
+OUTBOX_MAX_ATTEMPTS = 5
+# Failed posts wait 30s, 60s, 120s... (capped) before the next attempt
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_MAX_RETRY_DELAY = 3600
+OUTBOX_KEEP_SENT = 500  # sent/failed IDs remembered after compaction
+# Telegram allows ~20 messages per minute to the same group/channel
+TELEGRAM_MIN_INTERVAL = 3.0  # seconds between messages to the channel
+TELEGRAM_MAX_RETRY_AFTER = 120  # longer 429 waits are left to the next drain
+
+_outbox_lock = threading.Lock()
+_last_send_at = 0.0
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Telegram rate limit, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+_IMAGE_MIME_TYPES = {".png": "image/png", ".webp": "image/webp"}
+
+
+def _image_mime(name):
+    return _IMAGE_MIME_TYPES.get(os.path.splitext(name)[1].lower(), "image/jpeg")
+
+
+def _photo_upload(image):
     """
-    Sends the post to the Telegram channel.
+    Multipart tuple for `image`: a file path, raw bytes or an in-memory
+    buffer (e.g. create_cover(..., in_memory=True)). None if there is no image.
     """
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHANNEL_ID:
-        print("Telegram credentials missing. Skipping publish.")
-        return False
+    if image is None:
+        return None
+    if isinstance(image, (bytes, bytearray)):
+        return ("cover.jpg", bytes(image), "image/jpeg")
+    if hasattr(image, "read"):
+        image.seek(0)
+        name = os.path.basename(getattr(image, "name", "cover.jpg"))
+        return (name, image, _image_mime(name))
+    if os.path.exists(image):
+        with open(image, "rb") as f:
+            return (os.path.basename(image), f.read(), _image_mime(image))
+    return None
 
-    url_photo = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
-    
-    try:
-        # Prepare payload
-        data = {
-            "chat_id": TELEGRAM_CHANNEL_ID,
-            "caption": text,
-            "parse_mode": "Markdown" 
-        }
-        
-        # Send with image
-        if image_path and os.path.exists(image_path):
-            # Check caption length (Telegram limit is 1024 chars)
-            if len(text) > 1000:
-                # Send photo with short caption, then text
-                short_caption = text[:1000] + "..."
-                with open(image_path, "rb") as f:
-                    files = {"photo": f}
-                    # Send photo first (no caption or short caption if we wanted, but let's just send text separately)
-                    # Actually, better UX: Send photo with no caption, then full text.
-                    # Or: Send photo with title, then body.
-                    # Let's go with: Photo + "New Post below" -> Text
-                    
-                    requests.post(url_photo, data={"chat_id": TELEGRAM_CHANNEL_ID}, files=files)
-                
-                # Send full text as separate message (limit 4096)
-                url_msg = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-                data = {"chat_id": TELEGRAM_CHANNEL_ID, "text": text, "parse_mode": "Markdown"}
-                response = requests.post(url_msg, data=data)
-            else:
-                # Normal photo + caption
-                with open(image_path, "rb") as f:
-                    files = {"photo": f}
-                    response = requests.post(url_photo, data=data, files=files)
+
+def _telegram_call(method, data, files=None):
+    """
+    Calls a Bot API method, spacing messages by TELEGRAM_MIN_INTERVAL and
+    honouring 429 `retry_after`. Raises RateLimited if the wait is too long.
+    `files` may be a callable returning the files dict; it is rebuilt for
+    every attempt, since a retry can't reuse an upload stream already read.
+    """
+    global _last_send_at
+    url = f"{TELEGRAM_API_BASE}/bot{TELEGRAM_BOT_TOKEN}/{method}"
+    while True:
+        wait = _last_send_at + TELEGRAM_MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        with metrics.timer("telegram_request", method=method):
+            response = http_client.post(url, data=data, files=files() if callable(files) else files)
+        _last_send_at = time.monotonic()
+        metrics.incr("telegram_calls")
+        if response.status_code != 429:
+            return response
+        metrics.incr("telegram_429")
+
+        try:
+            retry_after = response.json().get("parameters", {}).get("retry_after", 5)
+        except ValueError:
+            retry_after = 5
+        if retry_after > TELEGRAM_MAX_RETRY_AFTER:
+            raise RateLimited(retry_after)
+        print(f"Telegram rate limit hit. Waiting {retry_after}s...")
+        time.sleep(retry_after)
+
+
+# --- Formatting ---
+# LLM drafts use loose Markdown (**bold**, *bold*, _italic_, `code`, [text](url)).
+# Instead of sending parse_mode=Markdown and retrying as plain text when
+# Telegram rejects it, drafts are converted locally to escaped Telegram HTML,
+# so every message goes out in one request with formatting intact.
+TELEGRAM_TEXT_LIMIT = 4096
+TELEGRAM_CAPTION_LIMIT = 1024
+ALLOWED_TAGS = {"b", "i", "u", "s", "code", "pre", "a"}
+
+_INLINE_RE = re.compile(
+    r"`(?P<code>[^`\n]+)`"
+    r"|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>https?://[^\s)]+)\)"
+    r"|\*\*(?P<bold>[^\n]+?)\*\*"
+    r"|(?<![\w*])\*(?P<bold_single>[^*\n]+?)\*(?![\w*])"
+    r"|(?<![\w/])_(?P<italic>[^_\n]+?)_(?![\w/])"
+)
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.*)$")
+_TAG_RE = re.compile(r"<(/?)([a-z]+)(?:\s[^>]*)?>")
+
+
+def _inline_to_html(text):
+    parts = []
+    position = 0
+    for match in _INLINE_RE.finditer(text):
+        parts.append(html.escape(text[position:match.start()], quote=False))
+        if match.group("code") is not None:
+            parts.append(f"<code>{html.escape(match.group('code'), quote=False)}</code>")
+        elif match.group("link_text") is not None:
+            url = html.escape(match.group("link_url"), quote=True)
+            parts.append(f'<a href="{url}">{_inline_to_html(match.group("link_text"))}</a>')
+        elif match.group("bold") is not None:
+            parts.append(f"<b>{_inline_to_html(match.group('bold'))}</b>")
+        elif match.group("bold_single") is not None:
+            parts.append(f"<b>{_inline_to_html(match.group('bold_single'))}</b>")
+        else:
+            parts.append(f"<i>{_inline_to_html(match.group('italic'))}</i>")
+        position = match.end()
+    parts.append(html.escape(text[position:], quote=False))
+    return "".join(parts)
+
+
+def markdown_to_html(text):
+    """Converts draft Markdown to Telegram HTML; unmatched markers stay literal."""
+    lines = []
+    for line in text.split("\n"):
+        heading = _HEADING_RE.match(line)
+        lines.append(f"<b>{_inline_to_html(heading.group(1))}</b>" if heading else _inline_to_html(line))
+    return "\n".join(lines)
+
+
+def validate_html(text):
+    """True if `text` only uses Telegram's tags and every tag is balanced."""
+    stack = []
+    for match in _TAG_RE.finditer(text):
+        closing, tag = match.group(1), match.group(2)
+        if tag not in ALLOWED_TAGS:
+            return False
+        if not closing:
+            stack.append(tag)
+        elif not stack or stack.pop() != tag:
+            return False
+    return not stack
+
+
+def visible_length(html_text):
+    """Length as Telegram counts it: UTF-16 code units of the text without tags."""
+    plain = html.unescape(_TAG_RE.sub("", html_text))
+    return len(plain.encode("utf-16-le")) // 2
+
+
+def _to_safe_html(markdown_text):
+    converted = markdown_to_html(markdown_text)
+    return converted if validate_html(converted) else html.escape(markdown_text, quote=False)
+
+
+def _split_units(text, separator):
+    pieces = text.split(separator)
+    return [piece + (separator if i < len(pieces) - 1 else "") for i, piece in enumerate(pieces)]
+
+
+def split_message(text, limit=TELEGRAM_TEXT_LIMIT, first_limit=None):
+    """
+    Converts a Markdown draft to HTML chunks that each fit Telegram's limit.
+    Splits happen on the Markdown source at paragraph, then line, then word
+    boundaries, so no entity is ever cut in half. `first_limit` applies to the
+    first chunk (e.g. a 1024-char photo caption).
+    """
+    chunks = []
+    current = ""
+
+    def current_limit():
+        return first_limit if (first_limit and not chunks) else limit
+
+    def flush():
+        nonlocal current
+        if current.strip():
+            chunks.append(_to_safe_html(current.strip("\n")))
+        current = ""
+
+    def add(unit, separators):
+        nonlocal current
+        if visible_length(_to_safe_html(current + unit)) <= current_limit():
+            current += unit
+            return
+        flush()
+        if visible_length(_to_safe_html(unit)) <= current_limit():
+            current = unit
+        elif separators:
+            for piece in _split_units(unit, separators[0]):
+                add(piece, separators[1:])
+        else:
+            # A single word longer than the limit: hard cut as a last resort,
+            # measured in UTF-16 units like visible_length (emoji count twice)
+            size = 0
+            for char in unit:
+                char_units = 2 if ord(char) > 0xFFFF else 1
+                if size + char_units > current_limit():
+                    flush()
+                    size = 0
+                current += char
+                size += char_units
+            flush()
+
+    for paragraph in _split_units(text, "\n\n"):
+        add(paragraph, ["\n", " "])
+    flush()
+    return chunks
+
+
+def _send(text, image, skip_parts=0, on_part_sent=None):
+    """
+    Sends one post as HTML. Returns True on success.
+    The post becomes one or more messages: a photo with the start of the
+    text as caption (if an image is given), then text messages for whatever
+    did not fit. skip_parts resumes after parts that were already delivered.
+    """
+    photo = _photo_upload(image)
+    if photo:
+        chunks = split_message(text, first_limit=TELEGRAM_CAPTION_LIMIT)
+        parts = [("sendPhoto", chunks[0] if chunks else "")] + [("sendMessage", chunk) for chunk in chunks[1:]]
+    else:
+        print("Sending text only (Image generation disabled).")
+        parts = [("sendMessage", chunk) for chunk in split_message(text)]
+
+    for index, (method, chunk) in enumerate(parts):
+        if index < skip_parts:
+            continue
+        if method == "sendPhoto":
+            data = {"chat_id": TELEGRAM_CHANNEL_ID, "caption": chunk, "parse_mode": "HTML"}
+            response = _telegram_call(method, data, files=lambda: {"photo": _photo_upload(image)})
         else:
-             # Just text? The prompt implies image is required for score >= 8
-            print("Sending text only (Image generation disabled).")
-            url_msg = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
             # Explicitly enable link previews (disable_web_page_preview=False)
             data = {
-                "chat_id": TELEGRAM_CHANNEL_ID, 
-                "text": text, 
-                "parse_mode": "Markdown",
-                "disable_web_page_preview": False 
+                "chat_id": TELEGRAM_CHANNEL_ID,
+                "text": chunk,
+                "parse_mode": "HTML",
+                "disable_web_page_preview": False
             }
-            response = requests.post(url_msg, data=data)
+            response = _telegram_call(method, data)
 
-        if response.status_code == 200:
-            print("Post published successfully.")
-            return True
-        else:
-            print(f"Failed to publish post (Markdown error?): {response.text}")
-            # FALLBACK: Try sending without Markdown
-            if "can't parse entities" in response.text or "Bad Request" in response.text:
-                print("⚠️ Markdown parsing failed. Retrying as plain text...")
-                data.pop("parse_mode", None) # Remove parse_mode completely
-                response_fallback = requests.post(url_msg, data=data)
-                if response_fallback.status_code == 200:
-                     print("Post published successfully (Plain Text Fallback).")
-                     return True
-                else:
-                    print(f"Failed to publish even as plain text: {response_fallback.text}")
-                    return False
+        if response.status_code != 200:
+            print(f"Failed to publish post (part {index + 1}/{len(parts)}): {response.text}")
             return False
+        if on_part_sent:
+            on_part_sent(index)
 
+    print("Post published successfully.")
+    return True
+
+
+def send_post(text, image_path):
+    """
+    Sends the post to the Telegram channel right away.
+    image_path may be a file path or an in-memory image buffer.
+    """
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHANNEL_ID:
+        print("Telegram credentials missing. Skipping publish.")
+        return False
+
+    try:
+        return _send(text, image_path)
     except Exception as e:
         print(f"Error publishing post: {e}")
         return False
+
+# --- Outbox queue ---
+
+def _image_record(image):
+    """JSON-safe form of an image: a path, or base64 for in-memory buffers."""
+    if image is None:
+        return None
+    if isinstance(image, str):
+        return {"path": image}
+    upload = _photo_upload(image)
+    content = upload[1].read() if hasattr(upload[1], "read") else upload[1]
+    return {"name": upload[0], "base64": base64.b64encode(content).decode("ascii")}
+
+
+def _image_from_record(record):
+    if not record:
+        return None
+    if "path" in record:
+        return record["path"]
+    # Named buffer, so the upload keeps the original file type
+    buffer = io.BytesIO(base64.b64decode(record["base64"]))
+    buffer.name = record.get("name", "cover.jpg")
+    return buffer
+
+
+def post_id(text, image=None):
+    image_key = json.dumps(_image_record(image), sort_keys=True)
+    return hashlib.sha256(f"{text}\n{image_key}".encode("utf-8")).hexdigest()[:16]
+
+
+def _append_events(*events):
+    with open(OUTBOX_FILE, "a", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+def _load_outbox():
+    """
+    Replays the event log. Returns (posts by id in queue order,
+    finished ids in log order mapped to "sent" or "failed").
+    """
+    posts, finished = {}, {}
+    if not os.path.exists(OUTBOX_FILE):
+        return posts, finished
+    with open(OUTBOX_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line after a crash
+            kind, pid = event.get("event"), event.get("id")
+            if kind == "queued" and finished.get(pid) != "sent":
+                # A post that failed before may be queued again
+                finished.pop(pid, None)
+                posts.setdefault(pid, dict(event, attempts=0, parts_sent=0, next_attempt_at=0))
+            elif kind == "part_sent" and pid in posts:
+                posts[pid]["parts_sent"] = max(posts[pid]["parts_sent"], event["index"] + 1)
+            elif kind == "attempt" and pid in posts:
+                posts[pid]["attempts"] += 1
+                posts[pid]["next_attempt_at"] = event.get("next_attempt_at", 0)
+            elif kind in ("sent", "failed"):
+                finished.pop(pid, None)  # keep log order: latest outcome last
+                finished[pid] = kind
+                posts.pop(pid, None)
+    return posts, finished
+
+
+def enqueue_post(text, image=None, meta=None):
+    """
+    Adds a post to the durable outbox and returns its id immediately.
+    Returns None if Telegram credentials are missing. Re-enqueueing a post
+    that is already queued or sent is a no-op; a failed one is queued again.
+    `meta` is stored with the post and handed to the drainer's on_sent callback.
+    """
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHANNEL_ID:
+        print("Telegram credentials missing. Skipping publish.")
+        return None
+
+    pid = post_id(text, image)
+    with _outbox_lock:
+        posts, finished = _load_outbox()
+        if pid in posts or finished.get(pid) == "sent":
+            print(f"Post {pid} already in outbox. Not queuing again.")
+            return pid
+        _append_events({
+            "event": "queued",
+            "id": pid,
+            "text": text,
+            "image": _image_record(image),
+            "meta": meta,
+            "queued_at": time.time(),
+        })
+    print(f"Post {pid} queued for publishing.")
+    _outbox_event.set()
+    return pid
+
+
+def pending_posts():
+    with _outbox_lock:
+        posts, _ = _load_outbox()
+    return list(posts.values())
+
+
+def _compact_outbox():
+    """Rewrites the log as the most recent finished ids + pending posts."""
+    with _outbox_lock:
+        posts, finished = _load_outbox()
+        events = [
+            {"event": kind, "id": pid}
+            for pid, kind in list(finished.items())[-OUTBOX_KEEP_SENT:]
+        ]
+        for post in posts.values():
+            events.append({k: post.get(k) for k in ("event", "id", "text", "image", "meta", "queued_at")})
+            if post["parts_sent"]:
+                events.append({"event": "part_sent", "id": post["id"], "index": post["parts_sent"] - 1})
+            for attempt in range(post["attempts"]):
+                event = {"event": "attempt", "id": post["id"]}
+                if attempt == post["attempts"] - 1:
+                    event["next_attempt_at"] = post["next_attempt_at"]
+                events.append(event)
+        tmp_path = OUTBOX_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, OUTBOX_FILE)
+
+
+def _retry_delay(attempts):
+    """Back-off before the next attempt of a post that has failed `attempts` times."""
+    return min(OUTBOX_MAX_RETRY_DELAY, OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def drain_outbox(on_sent=None):
+    """
+    Publishes every pending post that is due, in queue order. Returns the
+    number sent. Failed posts are retried with exponential back-off and
+    given up after OUTBOX_MAX_ATTEMPTS attempts; a long Telegram
+    retry_after leaves the rest for the next drain. `on_sent(post)` is
+    called for each delivered post.
+    """
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHANNEL_ID:
+        return 0
+
+    sent_count = 0
+    finished_any = False
+    now = time.time()
+    for post in pending_posts():
+        pid = post["id"]
+        if post["next_attempt_at"] > now:
+            continue
+
+        def mark_part_sent(index):
+            with _outbox_lock:
+                _append_events({"event": "part_sent", "id": pid, "index": index})
+
+        try:
+            ok = _send(post["text"], _image_from_record(post.get("image")),
+                       skip_parts=post["parts_sent"], on_part_sent=mark_part_sent)
+        except RateLimited as e:
+            print(f"{e}. Leaving remaining posts in the outbox.")
+            break
+        except Exception as e:
+            print(f"Error publishing post {pid}: {e}")
+            ok = False
+
+        attempts = post["attempts"] + 1
+        with _outbox_lock:
+            if ok:
+                _append_events({"event": "sent", "id": pid, "sent_at": time.time()})
+                sent_count += 1
+                finished_any = True
+            elif attempts >= OUTBOX_MAX_ATTEMPTS:
+                print(f"Giving up on post {pid} after {OUTBOX_MAX_ATTEMPTS} attempts.")
+                _append_events({"event": "failed", "id": pid})
+                finished_any = True
+            else:
+                delay = _retry_delay(attempts)
+                print(f"Post {pid} will be retried in {delay:.0f}s.")
+                _append_events({"event": "attempt", "id": pid, "next_attempt_at": time.time() + delay})
+
+        if ok and on_sent:
+            try:
+                on_sent(post)
+            except Exception as e:
+                print(f"Error recording published post {pid}: {e}")
+
+    # Only finished posts leave anything to fold away
+    if finished_any:
+        _compact_outbox()
+    return sent_count
+
+# --- Background drainer ---
+
+_outbox_event = threading.Event()
+_drainer_stop = threading.Event()
+_drainer_thread = None
+
+
+def _drainer_loop(on_sent):
+    while True:
+        _outbox_event.clear()
+        drain_outbox(on_sent)
+        if _drainer_stop.is_set():
+            return
+        _outbox_event.wait(timeout=5)
+
+
+def start_drainer(on_sent=None):
+    """
+    Publishes queued posts in a background thread until stop_drainer().
+    `on_sent(post)` runs for every delivered post (see drain_outbox).
+    """
+    global _drainer_thread
+    if _drainer_thread is None or not _drainer_thread.is_alive():
+        _drainer_stop.clear()
+        _drainer_thread = threading.Thread(target=_drainer_loop, args=(on_sent,), daemon=True)
+        _drainer_thread.start()
+    return _drainer_thread
+
+
+def stop_drainer(timeout=None):
+    """Lets the drainer finish one last pass over the outbox, then joins it."""
+    if _drainer_thread is None:
+        return
+    _drainer_stop.set()
+    _outbox_event.set()
+    _drainer_thread.join(timeout)
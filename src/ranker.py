@@ -0,0 +1,127 @@
+"""
+Local relevance scoring for scraped articles.
+
+Ranks candidates before any Gemini call so the per-run API budget goes to
+the articles most likely to survive the writer's SKIP and the critic's
+score: concrete projects with revenue figures and a named stack.
+Pure Python, no extra dependencies.
+"""
+import math
+import re
+from collections import Counter
+
+# Tools named in WRITER_PROMPT / CRITIC_PROMPT plus their common neighbours
+TOOL_NAMES = [
+    "cursor", "replit", "v0", "bolt", "lovable", "bubble", "flutterflow", "tilda",
+    "make", "zapier", "n8n", "webflow", "softr", "glide", "airtable", "supabase",
+    "firebase", "stripe", "openai", "gpt", "claude", "gemini", "python", "nextjs",
+]
+
+# Money / traction figures the critic rewards (+3 for real revenue)
+REVENUE_PATTERNS = [
+    re.compile(r"\$\s?\d[\d,.]*\s?[km]?\b", re.IGNORECASE),
+    re.compile(r"\b\d[\d,.]*\s?[km]?\s?(mrr|arr)\b", re.IGNORECASE),
+    re.compile(r"\b(mrr|arr|revenue|profit|paying (customers|users)|first customers?)\b", re.IGNORECASE),
+    re.compile(r"\b\d[\d,.]*\s?[km]?\+?\s(users|customers|subscribers|sales)\b", re.IGNORECASE),
+]
+
+# Phrases typical of a build story / case study
+STORY_PATTERNS = [
+    re.compile(r"\b(i|we) (built|made|launched|shipped|grew|scaled)\b", re.IGNORECASE),
+    re.compile(r"\b(how i|how we|case study|side project|my saas|micro.?saas|launch(ed)?)\b", re.IGNORECASE),
+]
+
+# Signals of discussion threads rather than projects
+NEGATIVE_PATTERNS = [
+    re.compile(r"\?\s*$"),
+    re.compile(r"\b(anyone|hiring|rant|thoughts on|what do you think|recommend)\b", re.IGNORECASE),
+]
+
+PROFILE_TERMS = set(TOOL_NAMES) | {"mrr", "arr", "revenue", "customers", "users", "saas", "built", "launched", "nocode", "growth"}
+
+WEIGHTS = {
+    "revenue": 3.0,
+    "tools": 1.5,
+    "story": 1.0,
+    "negative": -2.0,
+    "tfidf": 4.0,
+}
+
+# Articles scoring below this are dropped before any API call
+MIN_RANK_SCORE = 0.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9$]+")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _article_text(article):
+    summary = _TAG_RE.sub(" ", article.get("summary", ""))
+    return f"{article.get('title', '')} {summary}"
+
+
+def _tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _feature_score(article):
+    title = article.get("title", "")
+    text = _article_text(article)
+    tokens = set(_tokenize(text))
+
+    revenue = sum(1 for p in REVENUE_PATTERNS if p.search(text))
+    tools = min(3, len(tokens & set(TOOL_NAMES)))
+    story = sum(1 for p in STORY_PATTERNS if p.search(text))
+    negative = sum(1 for p in NEGATIVE_PATTERNS if p.search(title))
+
+    return (WEIGHTS["revenue"] * revenue
+            + WEIGHTS["tools"] * tools
+            + WEIGHTS["story"] * story
+            + WEIGHTS["negative"] * negative)
+
+
+def _tfidf_scores(token_lists):
+    """
+    Relevance of each document to PROFILE_TERMS, weighted by TF-IDF over the
+    batch: a term every feed mentions (e.g. "saas" on r/SaaS) counts less.
+    """
+    n_docs = len(token_lists)
+    doc_freq = Counter()
+    for tokens in token_lists:
+        doc_freq.update(set(tokens) & PROFILE_TERMS)
+
+    scores = []
+    for tokens in token_lists:
+        if not tokens:
+            scores.append(0.0)
+            continue
+        counts = Counter(tokens)
+        score = 0.0
+        for term in PROFILE_TERMS & counts.keys():
+            tf = counts[term] / len(tokens)
+            idf = math.log((n_docs + 1) / (doc_freq[term] + 1)) + 1
+            score += tf * idf
+        scores.append(score)
+    return scores
+
+
+def score_articles(articles):
+    """Returns a relevance score per article (same order)."""
+    token_lists = [_tokenize(_article_text(a)) for a in articles]
+    tfidf = _tfidf_scores(token_lists)
+    return [
+        _feature_score(article) + WEIGHTS["tfidf"] * tfidf_score
+        for article, tfidf_score in zip(articles, tfidf)
+    ]
+
+
+def rank_articles(articles, top_k=None, min_score=MIN_RANK_SCORE):
+    """
+    Sorts articles by local relevance (best first), drops those below
+    min_score and keeps at most top_k. Stable for equal scores.
+    """
+    scores = score_articles(articles)
+    ranked = sorted(zip(scores, range(len(articles)), articles), key=lambda x: (-x[0], x[1]))
+    result = [article for score, _, article in ranked if score >= min_score]
+    if top_k is not None:
+        result = result[:top_k]
+    return result
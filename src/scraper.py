@@ -1,45 +1,280 @@
-import feedparser
+import hashlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+from .config import FEED_FETCH_WORKERS, FEED_MAX_PER_HOST, FEED_TIMEOUT, FEED_USER_AGENT
+from .utils import load_feed_state, save_feed_state, increment_feed_published, is_url_processed
+from .http_client import get_session
+from .urls import canonicalize_url
+from . import metrics
 
-def scrape_feeds(feed_urls):
+# Smoothing for the per-feed yield and new-entry rate averages
+YIELD_EMA_ALPHA = 0.3
+# Bounds for how often a single feed is polled (seconds)
+FEED_MIN_INTERVAL = 15 * 60
+FEED_MAX_INTERVAL = 12 * 3600
+# (published, yielded) prior for the publish pass-through rate, so a feed is
+# not throttled on its first few articles
+PASS_RATE_PRIOR = (1, 10)
+
+JUNK_KEYWORDS = ['help', 'question', 'advice needed', 'looking for', 'request', 'feedback on idea']
+
+def _host_semaphores(feed_urls):
+    """One semaphore per host, so e.g. the reddit.com feeds share a cap."""
+    hosts = {urlparse(url).netloc for url in feed_urls}
+    return {host: threading.BoundedSemaphore(FEED_MAX_PER_HOST) for host in hosts}
+
+def _fetch_feed(session, url, semaphores, cached):
     """
-    Scrapes RSS feeds and returns a list of dictionaries with title, link, and summary.
+    Downloads a feed, respecting the per-host limit.
+    Sends the cached validators as a conditional GET; returns the response.
+    """
+    headers = {"User-Agent": FEED_USER_AGENT}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    with semaphores[urlparse(url).netloc]:
+        print(f"Fetching {url}...")
+        response = session.get(url, headers=headers, timeout=FEED_TIMEOUT)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+def _entry_id(entry):
+    return entry.get('id') or entry.get('link') or entry.get('title', '')
+
+def _parse_entries(raw, url):
+    """
+    Parses raw feed bytes and applies the junk/length filters.
+    Returns (articles, entry_ids) where entry_ids covers every entry in the feed.
     """
     articles = []
-    print("Scraping feeds...")
-    for url in feed_urls:
-        try:
-            print(f"Parsing {url}...")
-            feed = feedparser.parse(url)
-            for entry in feed.entries:
-                # Basic filtering to ensure we have content
-                if hasattr(entry, 'link') and hasattr(entry, 'title'):
-                    summary = getattr(entry, 'summary', '')
-                    # If summary is empty, sometimes content is in 'content' field
-                    if not summary and hasattr(entry, 'content'):
-                        summary = entry.content[0].value if entry.content else ''
-                    
-                    # Smart Filter: Check for "junk" keywords in title
-                    title_lower = entry.title.lower()
-                    junk_keywords = ['help', 'question', 'advice needed', 'looking for', 'request', 'feedback on idea']
-                    
-                    if any(keyword in title_lower for keyword in junk_keywords):
-                        print(f"Skipping (Junk keyword): {entry.title}")
-                        continue
-                        
-                    # Filter out very short content (likely just a link or empty post)
-                    if len(summary) < 50:
-                        print(f"Skipping (Too short): {entry.title}")
+    entry_ids = []
+    import feedparser  # deferred: only runs that actually parse feeds pay for it
+    feed = feedparser.parse(raw)
+    for entry in feed.entries:
+        entry_ids.append(_entry_id(entry))
+
+        # Basic filtering to ensure we have content
+        if hasattr(entry, 'link') and hasattr(entry, 'title'):
+            summary = getattr(entry, 'summary', '')
+            # If summary is empty, sometimes content is in 'content' field
+            if not summary and hasattr(entry, 'content'):
+                summary = entry.content[0].value if entry.content else ''
+
+            # Smart Filter: Check for "junk" keywords in title
+            title_lower = entry.title.lower()
+
+            if any(keyword in title_lower for keyword in JUNK_KEYWORDS):
+                print(f"Skipping (Junk keyword): {entry.title}")
+                continue
+
+            # Filter out very short content (likely just a link or empty post)
+            if len(summary) < 50:
+                print(f"Skipping (Too short): {entry.title}")
+                continue
+
+            articles.append({
+                'title': entry.title,
+                'link': entry.link,
+                'summary': summary,
+                'source': url
+            })
+    return articles, entry_ids
+
+def _update_stats(state, cached, count, new_entries):
+    """
+    Carries the per-feed statistics over into `state`: the yield average
+    used to order feeds, and the new-entry rate / publish pass-through
+    used to decide how often the feed is polled.
+    """
+    now = time.time()
+    previous = cached.get("avg_yield")
+    state["avg_yield"] = count if previous is None else (1 - YIELD_EMA_ALPHA) * previous + YIELD_EMA_ALPHA * count
+    state["new_rate"] = cached.get("new_rate")
+    if cached.get("fetched_at"):
+        hours = max((now - cached["fetched_at"]) / 3600, 1 / 60)
+        rate = new_entries / hours
+        state["new_rate"] = rate if state["new_rate"] is None else (1 - YIELD_EMA_ALPHA) * state["new_rate"] + YIELD_EMA_ALPHA * rate
+    state["fetched_at"] = now
+    state["yielded"] = cached.get("yielded", 0) + count
+    state["published"] = cached.get("published", 0)
+    state["errors"] = 0
+    return state
+
+def _scrape_one(session, url, semaphores, cached):
+    """
+    Fetches and parses one feed.
+    Returns (articles, new_state) where new_state replaces the feed's cache entry.
+
+    The validators and body hash only save downloading and parsing a feed
+    that did not change; which entries are new is left to is_url_processed.
+    The parsed articles are kept in the state as "pending", so an unchanged
+    feed re-returns the ones that were not picked (or failed and await a
+    retry) without being downloaded or parsed again.
+    """
+    pending = cached.get("pending", [])
+    try:
+        with metrics.timer("feed_fetch", feed=url):
+            response = _fetch_feed(session, url, semaphores, cached)
+        metrics.incr("feeds_fetched")
+        if response.status_code == 304:
+            print(f"Not modified: {url}")
+            metrics.incr("feeds_not_modified")
+            return list(pending), _update_stats(dict(cached), cached, 0, 0)
+
+        raw = response.content
+        content_hash = hashlib.sha256(raw).hexdigest()
+        new_state = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+            "entry_ids": cached.get("entry_ids", []),
+            "pending": pending,
+        }
+        # Servers without validators still often return byte-identical bodies
+        if content_hash == cached.get("content_hash"):
+            print(f"Unchanged content: {url}")
+            metrics.incr("feeds_not_modified")
+            return list(pending), _update_stats(new_state, cached, 0, 0)
+
+        articles, entry_ids = _parse_entries(raw, url)
+        new_entries = len(set(entry_ids) - set(cached.get("entry_ids", [])))
+        # Re-returned pending articles don't count towards the feed's yield again
+        previous_links = {a['link'] for a in pending}
+        fresh = sum(1 for a in articles if a['link'] not in previous_links)
+        new_state["entry_ids"] = entry_ids
+        new_state["pending"] = articles
+        return articles, _update_stats(new_state, cached, fresh, new_entries)
+    except Exception as e:
+        print(f"Error parsing feed {url}: {e}")
+        metrics.incr("feed_errors")
+        # Keep the validators, stats and pending articles; remember the failure for back-off
+        return list(pending), dict(cached, failed_at=time.time(), errors=cached.get("errors", 0) + 1)
+
+def feed_poll_interval(stats):
+    """
+    Seconds to wait before fetching a feed again: roughly the time it takes
+    to post one new entry, stretched for feeds whose articles rarely make it
+    to the channel and shortened for ones that often do.
+    """
+    rate = stats.get("new_rate")
+    if rate is None:
+        return FEED_MIN_INTERVAL
+    interval = 3600 / rate if rate > 0 else FEED_MAX_INTERVAL
+    prior_published, prior_yielded = PASS_RATE_PRIOR
+    pass_rate = (stats.get("published", 0) + prior_published) / (stats.get("yielded", 0) + prior_yielded)
+    interval *= min(4.0, max(0.5, (prior_published / prior_yielded) / pass_rate))
+    return min(FEED_MAX_INTERVAL, max(FEED_MIN_INTERVAL, interval))
+
+def feed_error_backoff(stats):
+    """Seconds to wait after the last failed fetch: doubles per consecutive error."""
+    errors = stats.get("errors", 0)
+    if not errors:
+        return 0
+    return min(FEED_MAX_INTERVAL, FEED_MIN_INTERVAL * 2 ** (errors - 1))
+
+def feed_due_at(url, feed_state):
+    stats = feed_state.get(url, {})
+    due_at = stats.get("fetched_at", 0) + feed_poll_interval(stats)
+    if stats.get("errors"):
+        # A blocked or throttling host is backed off instead of retried every poll
+        due_at = max(due_at, stats.get("failed_at", 0) + feed_error_backoff(stats))
+    return due_at
+
+def due_feeds(feed_urls, feed_state, now=None):
+    """Feeds whose poll interval has elapsed (never-fetched feeds are always due)."""
+    now = now or time.time()
+    return [url for url in feed_urls if feed_due_at(url, feed_state) <= now]
+
+def next_feed_due_in(feed_urls, feed_state, now=None):
+    """Seconds until the earliest feed becomes due (0 if one already is)."""
+    now = now or time.time()
+    return max(0.0, min((feed_due_at(url, feed_state) for url in feed_urls), default=FEED_MAX_INTERVAL) - now)
+
+def record_feed_published(url):
+    """Counts a published post against its source feed's pass-through rate."""
+    if url:
+        increment_feed_published(url)
+
+def order_feeds_by_yield(feed_urls, feed_state):
+    """Highest historical yield first; never-fetched feeds go first of all."""
+    return sorted(feed_urls, key=lambda url: -feed_state.get(url, {}).get("avg_yield", float("inf")))
+
+def iter_feeds(feed_urls, workers=FEED_FETCH_WORKERS, use_cache=True, only_due=False):
+    """
+    Streams articles as feeds finish downloading, best-yielding feeds first.
+    With only_due=True, feeds polled more recently than their adaptive
+    interval (see feed_poll_interval) are left out.
+
+    At most `workers` feeds are in flight; closing the generator early
+    (break / .close()) cancels feeds that have not started yet. Feed state
+    is only advanced for feeds whose articles were all consumed, so a feed
+    that was cut short is fetched in full next time.
+    """
+    start = time.time()
+    feed_state = load_feed_state() if use_cache else {}
+    if only_due:
+        skipped = len(feed_urls)
+        feed_urls = due_feeds(feed_urls, feed_state)
+        skipped -= len(feed_urls)
+        if skipped:
+            print(f"{skipped} feeds not due yet, skipping them this time.")
+            metrics.incr("feeds_not_due", skipped)
+    semaphores = _host_semaphores(feed_urls)
+    queue = order_feeds_by_yield(feed_urls, feed_state)
+    session = get_session()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = {}
+    seen_links = set()
+    yielded = 0
+
+    try:
+        while queue or pending:
+            while queue and len(pending) < workers:
+                url = queue.pop(0)
+                pending[executor.submit(_scrape_one, session, url, semaphores, feed_state.get(url, {}))] = url
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                feed_articles, new_state = future.result()
+                # History is checked here, not in the workers: its index loads lazily.
+                # Processed articles also leave the feed's stored pending list.
+                feed_articles = [a for a in feed_articles if not is_url_processed(a['link'])]
+                if new_state and "pending" in new_state:
+                    new_state["pending"] = [dict(a) for a in feed_articles]
+                for article in feed_articles:
+                    # The same post can appear in several feeds under different URLs
+                    canonical = canonicalize_url(article['link'])
+                    if canonical in seen_links:
                         continue
+                    seen_links.add(canonical)
+                    yielded += 1
+                    yield article
+                if new_state:
+                    feed_state[url] = new_state
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if use_cache:
+            save_feed_state(feed_state)
+        print(f"Streamed {yielded} articles in {time.time() - start:.1f}s.")
 
-                    articles.append({
-                        'title': entry.title,
-                        'link': entry.link,
-                        'summary': summary,
-                        'source': url
-                    })
-        except Exception as e:
-            print(f"Error parsing feed {url}: {e}")
-            
+def scrape_feeds(feed_urls, parallel=True, use_cache=True):
+    """
+    Scrapes RSS feeds and returns a list of dictionaries with title, link, and summary.
+
+    With parallel=True (default) feeds are downloaded concurrently, so the
+    order follows feed yield and completion rather than feed_urls.
+    With use_cache=True (default) feeds are fetched with conditional GETs;
+    an unchanged feed is not parsed again, its stored unprocessed articles
+    are returned instead. Articles already in history are never returned.
+    """
+    print("Scraping feeds...")
+    workers = FEED_FETCH_WORKERS if parallel else 1
+    articles = list(iter_feeds(feed_urls, workers=workers, use_cache=use_cache))
     print(f"Found {len(articles)} articles.")
     return articles
@@ -0,0 +1,77 @@
+"""
+URL canonicalization for history lookups.
+
+The same post reaches us under many URLs: old./m./np.reddit.com mirrors,
+redd.it short links, with or without the title slug, trailing slashes,
+utm_* tracking parameters, Product Hunt feed links with campaign params.
+canonicalize_url maps all of these to one stable key.
+"""
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+HOST_ALIASES = {
+    "reddit.com": "www.reddit.com",
+    "old.reddit.com": "www.reddit.com",
+    "new.reddit.com": "www.reddit.com",
+    "np.reddit.com": "www.reddit.com",
+    "m.reddit.com": "www.reddit.com",
+    "i.reddit.com": "www.reddit.com",
+    "producthunt.com": "www.producthunt.com",
+    "indiehackers.com": "www.indiehackers.com",
+    "www.dev.to": "dev.to",
+}
+
+# Query parameters that never change the target page
+TRACKING_PARAMS = {
+    "ref", "ref_src", "ref_url", "source", "fbclid", "gclid", "yclid",
+    "mc_cid", "mc_eid", "igshid", "si", "share_id", "context",
+}
+TRACKING_PREFIXES = ("utm_",)
+
+_REDDIT_COMMENTS_RE = re.compile(r"^(?:/r/[^/]+)?/comments/([a-z0-9]+)", re.IGNORECASE)
+_PRODUCTHUNT_RE = re.compile(r"^/(posts|products)/([^/]+)", re.IGNORECASE)
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url):
+    """Returns the canonical form of `url` (unparseable input is returned stripped)."""
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    if not parts.netloc:
+        return url
+
+    host = parts.hostname or ""
+    host = HOST_ALIASES.get(host, host)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+
+    # Reddit: the base-36 post ID is the identity; subreddit and slug are decoration
+    if host == "redd.it" and len(path) > 1:
+        return f"https://www.reddit.com/comments/{path.strip('/').lower()}"
+    if host == "www.reddit.com":
+        match = _REDDIT_COMMENTS_RE.match(path)
+        if match:
+            return f"https://www.reddit.com/comments/{match.group(1).lower()}"
+
+    # Product Hunt: /posts/<slug> or /products/<slug>, feed params dropped
+    if host == "www.producthunt.com":
+        match = _PRODUCTHUNT_RE.match(path)
+        if match:
+            return f"https://www.producthunt.com/{match.group(1).lower()}/{match.group(2)}"
+
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking_param(k))
+    return urlunsplit(("https", host, path, urlencode(query), ""))
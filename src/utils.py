@@ -1,11 +1,40 @@
+import bisect
+import hashlib
 import json
 import os
+import threading
 from datetime import datetime, timedelta
+from .dedupe import add_signature
+from .urls import canonicalize_url
 
 HISTORY_FILE = "history.json"
-DIGEST_FILE = "digest.json"
+# Append-only log of URLs added since the last compaction of HISTORY_FILE.
+# history.json stays the canonical snapshot; new URLs are appended here one
+# per line and folded back into the snapshot once the log grows large.
+HISTORY_LOG_FILE = "history.log"
+HISTORY_COMPACT_THRESHOLD = 200
+# Digest entries, one JSON object per line in published_at order. Entries
+# older than DIGEST_RETENTION_DAYS are moved a week at a time into the archive
+# so the active file stays small; digest.json is the pre-JSONL format and is
+# migrated on first load.
+DIGEST_FILE = "digest.jsonl"
+DIGEST_ARCHIVE_FILE = "digest_archive.jsonl"
+LEGACY_DIGEST_FILE = "digest.json"
+DIGEST_RETENTION_DAYS = 28
+# Per-feed conditional-GET validators, last fetch's entry IDs and pending articles
+FEED_STATE_FILE = "feed_state.json"
+# Serializes feed_state.json read-modify-writes between scraping and the outbox drainer
+_feed_state_lock = threading.Lock()
 
-def load_history():
+# In-process history index: loaded once, then kept in sync on every write.
+_history_list = None
+_history_set = None
+_history_log_lines = 0
+# In-process digest index: entries plus their published_at keys for bisect.
+_digest_entries = None
+_digest_keys = None
+
+def _read_history_snapshot():
     if not os.path.exists(HISTORY_FILE):
         return []
     try:
@@ -14,48 +43,248 @@ def load_history():
     except json.JSONDecodeError:
         return []
 
+def _read_history_log():
+    if not os.path.exists(HISTORY_LOG_FILE):
+        return []
+    with open(HISTORY_LOG_FILE, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def _ensure_history_loaded():
+    """Loads snapshot + append log into memory once per process."""
+    global _history_list, _history_set, _history_log_lines
+    if _history_set is not None:
+        return
+
+    _history_list = []
+    _history_set = set()
+    log_urls = _read_history_log()
+    _history_log_lines = len(log_urls)
+    # Entries are canonicalized on load too, so a legacy raw URL still matches
+    for url in _read_history_snapshot() + log_urls:
+        url = canonicalize_url(url)
+        if url not in _history_set:
+            _history_set.add(url)
+            _history_list.append(url)
+
+def reset_history_cache():
+    """Drops the in-memory index so the next lookup re-reads from disk."""
+    global _history_list, _history_set, _history_log_lines
+    _history_list = None
+    _history_set = None
+    _history_log_lines = 0
+
+def load_history():
+    _ensure_history_loaded()
+    return list(_history_list)
+
 def save_history(history):
+    """Writes a full snapshot and truncates the append log."""
+    global _history_list, _history_set, _history_log_lines
     with open(HISTORY_FILE, "w", encoding="utf-8") as f:
         json.dump(history, f, indent=4, ensure_ascii=False)
+    # Truncate rather than delete so the workflow can always `git add` it
+    open(HISTORY_LOG_FILE, "w", encoding="utf-8").close()
+    _history_list = list(history)
+    _history_set = set(history)
+    _history_log_lines = 0
+
+def compact_history():
+    """Folds the append log into history.json."""
+    _ensure_history_loaded()
+    if _history_log_lines:
+        save_history(_history_list)
+
+def canonicalize_history():
+    """One-shot rewrite of history.json (and the log) into canonical URL keys."""
+    reset_history_cache()
+    _ensure_history_loaded()
+    save_history(_history_list)
+    print(f"History canonicalized: {len(_history_list)} unique URLs.")
 
 def is_url_processed(url):
-    history = load_history()
-    return url in history
+    _ensure_history_loaded()
+    return canonicalize_url(url) in _history_set
 
 def add_url_to_history(url):
-    history = load_history()
-    if url not in history:
-        history.append(url)
-        save_history(history)
+    global _history_log_lines
+    _ensure_history_loaded()
+    url = canonicalize_url(url)
+    if url in _history_set:
+        return
+    _history_set.add(url)
+    _history_list.append(url)
+    with open(HISTORY_LOG_FILE, "a", encoding="utf-8") as f:
+        f.write(url + "\n")
+    _history_log_lines += 1
+    if _history_log_lines >= HISTORY_COMPACT_THRESHOLD:
+        compact_history()
 
-# --- Digest helpers ---
+def add_article_to_history(article):
+    """Marks an article as processed: its URL and its near-duplicate signature."""
+    add_url_to_history(article['link'])
+    add_signature(article['title'], article.get('summary', ''))
 
-def load_digest():
-    if not os.path.exists(DIGEST_FILE):
-        return []
+# --- Feed state helpers ---
+
+def load_feed_state():
+    """Returns {feed_url: {"etag", "last_modified", "content_hash", "entry_ids", "pending", ...}}."""
+    if not os.path.exists(FEED_STATE_FILE):
+        return {}
     try:
-        with open(DIGEST_FILE, "r", encoding="utf-8") as f:
+        with open(FEED_STATE_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
     except json.JSONDecodeError:
+        return {}
+
+def _write_feed_state(state):
+    with open(FEED_STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=4, ensure_ascii=False)
+
+def save_feed_state(state):
+    """
+    Writes a scrape's feed state. Publish counts are only ever incremented
+    (by the outbox drainer, possibly mid-scrape), so the larger of the
+    on-disk and in-memory count is kept instead of the scrape's stale copy.
+    """
+    with _feed_state_lock:
+        on_disk = load_feed_state()
+        for url, stats in state.items():
+            published = on_disk.get(url, {}).get("published", 0)
+            if published > stats.get("published", 0):
+                stats["published"] = published
+        _write_feed_state(state)
+
+def increment_feed_published(url):
+    """Counts one delivered post for `url`'s feed; returns False for unknown feeds."""
+    with _feed_state_lock:
+        state = load_feed_state()
+        if url not in state:
+            return False
+        state[url]["published"] = state[url].get("published", 0) + 1
+        _write_feed_state(state)
+        return True
+
+# --- Digest helpers ---
+
+def _digest_timestamp(value):
+    """Normalizes legacy day strings ("2025-02-17") to full ISO timestamps."""
+    return value if "T" in value else f"{value}T00:00:00"
+
+def _read_digest_jsonl(path):
+    if not os.path.exists(path):
         return []
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+def _write_digest_jsonl(path, entries, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def _migrate_legacy_digest():
+    """Folds the old digest.json list into the JSONL store, then removes it."""
+    if not os.path.exists(LEGACY_DIGEST_FILE):
+        return []
+    try:
+        with open(LEGACY_DIGEST_FILE, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except json.JSONDecodeError:
+        legacy = []
+    for entry in legacy:
+        entry["published_at"] = _digest_timestamp(entry.get("published_at", ""))
+    _write_digest_jsonl(DIGEST_FILE, legacy, mode="a")
+    os.remove(LEGACY_DIGEST_FILE)
+    return legacy
+
+def _ensure_digest_loaded():
+    """Loads the active digest store into a published_at-sorted index once per process."""
+    global _digest_entries, _digest_keys
+    if _digest_entries is not None:
+        return
+    entries = _read_digest_jsonl(DIGEST_FILE) + _migrate_legacy_digest()
+    for entry in entries:
+        entry["published_at"] = _digest_timestamp(entry.get("published_at", ""))
+    # Appends are chronological, so this is a no-op sort except after migration
+    entries.sort(key=lambda e: e["published_at"])
+    _digest_entries = entries
+    _digest_keys = [e["published_at"] for e in entries]
+
+def reset_digest_cache():
+    """Drops the in-memory digest index so the next query re-reads from disk."""
+    global _digest_entries, _digest_keys
+    _digest_entries = None
+    _digest_keys = None
+
+def load_digest():
+    _ensure_digest_loaded()
+    return list(_digest_entries)
 
 def save_digest(digest):
-    with open(DIGEST_FILE, "w", encoding="utf-8") as f:
-        json.dump(digest, f, indent=4, ensure_ascii=False)
+    """Rewrites the active digest store (sorted by published_at)."""
+    global _digest_entries, _digest_keys
+    entries = sorted(digest, key=lambda e: e["published_at"])
+    _write_digest_jsonl(DIGEST_FILE, entries)
+    _digest_entries = entries
+    _digest_keys = [e["published_at"] for e in entries]
+
+def archive_digest(before):
+    """Moves entries published before `before` (ISO timestamp) to the archive file."""
+    _ensure_digest_loaded()
+    cut = bisect.bisect_left(_digest_keys, before)
+    if not cut:
+        return 0
+    _write_digest_jsonl(DIGEST_ARCHIVE_FILE, _digest_entries[:cut], mode="a")
+    save_digest(_digest_entries[cut:])
+    return cut
 
-def add_to_digest(title, url):
-    """Records a published post for the weekly digest."""
-    digest = load_digest()
+def _archive_cutoff(now):
+    """Start of the week that is DIGEST_RETENTION_DAYS old: archival moves whole weeks at once."""
+    oldest_kept = now - timedelta(days=DIGEST_RETENTION_DAYS)
+    week_start = (oldest_kept - timedelta(days=oldest_kept.weekday())).date()
+    return f"{week_start.isoformat()}T00:00:00"
+
+def digest_entry_id(url):
+    """Stable short key for a digest entry, used to match structured annotations."""
+    return hashlib.sha256(canonicalize_url(url).encode("utf-8")).hexdigest()[:12]
+
+def add_to_digest(title, url, annotation=None):
+    """Records a published post for the weekly digest, with its one-line annotation if known."""
+    _ensure_digest_loaded()
+    now = datetime.utcnow()
     entry = {
+        "id": digest_entry_id(url),
         "title": title,
         "url": url,
-        "published_at": datetime.utcnow().strftime("%Y-%m-%d")
+        "published_at": now.isoformat(timespec="seconds")
     }
-    digest.append(entry)
-    save_digest(digest)
+    if annotation:
+        entry["annotation"] = annotation
+    position = bisect.bisect_right(_digest_keys, entry["published_at"])
+    _digest_keys.insert(position, entry["published_at"])
+    _digest_entries.insert(position, entry)
+    _write_digest_jsonl(DIGEST_FILE, [entry], mode="a")
+
+    cutoff = _archive_cutoff(now)
+    if _digest_keys and _digest_keys[0] < cutoff:
+        archive_digest(cutoff)
+
+def get_digest_entries(since, until=None):
+    """Returns entries with since <= published_at < until (datetimes, UTC), via bisect."""
+    _ensure_digest_loaded()
+    lo = bisect.bisect_left(_digest_keys, since.isoformat(timespec="seconds"))
+    hi = (bisect.bisect_left(_digest_keys, until.isoformat(timespec="seconds"))
+          if until else len(_digest_keys))
+    return _digest_entries[lo:hi]
 
 def get_weekly_digest_entries():
     """Returns all digest entries published in the last 7 days."""
-    digest = load_digest()
-    cutoff = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%d")
-    return [e for e in digest if e.get("published_at", "") >= cutoff]
+    return get_digest_entries(datetime.utcnow() - timedelta(days=7))